@@ -0,0 +1,298 @@
+import numpy as np
+import pandas as pd
+import sys
+import argparse
+import json
+import os.path
+import socket
+import tempfile
+import resource
+import random
+import contextlib
+import warnings
+import time as tm
+import multiprocessing
+import queue
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+"""
+
+    Usage:
+
+    benchmark.py --router tomtom --rows 1000 10000 --latency 20
+    benchmark.py --router ors --api v2 --rows 1000 --error-rate 0.01 --route-args="--workers 16 --parse-procs 2"
+        routes synthetic --infile files of each --rows size with route.py against a local stand-in
+        of the routing API and prints requests/s, latency percentiles, parse CPU time and peak memory
+
+    Description: measure route.py without spending API quota
+
+
+"""
+
+
+class Benchmark:
+    def __init__(self):
+        parser = argparse.ArgumentParser(description='time route.py against a local stand-in of the routing API')
+        parser.add_argument('--router', help='API imitated by the mock server', required=False, default='tomtom',
+                            choices=['tomtom', 'ors'])
+        parser.add_argument('--api', help='openrouteservice API flavour of the mock server', required=False,
+                            default='v2', choices=['v1', 'v2'])
+        parser.add_argument('--rows', help='sizes of the synthetic --infile files routed', type=int, nargs='+',
+                            required=False, default=[1000])
+        parser.add_argument('--latency', help='milliseconds the mock server waits before each answer', type=float,
+                            required=False, default=20)
+        parser.add_argument('--error-rate', dest='error_rate', help='share of the requests answered 503',
+                            type=float, required=False, default=0)
+        parser.add_argument('--points', help='points of each route returned', type=int, required=False, default=200)
+        parser.add_argument('--port', help='port of the mock server', type=int, required=False, default=8089)
+        parser.add_argument('--server-procs', dest='server_procs', help='mock server processes sharing the port',
+                            type=int, required=False, default=2)
+        parser.add_argument('--route-args', dest='route_args', help='more route.py arguments, as one string: '
+                            '--route-args="--workers 16"',
+                            required=False, default='--summary --geometry')
+        parser.add_argument('--workdir', help='directory of the synthetic input and of the outputs, a temporary '
+                            'one if empty', required=False, default='')
+        parser.add_argument('--seed', help='seed of the synthetic coordinates', type=int, required=False, default=1)
+        self.parser = parser
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """
+        Answers route requests with TomTom or openrouteservice v1/v2 shaped payloads, the route
+        is a wavy line of MockHandler.points points from the requested start to end
+    """
+    protocol_version = 'HTTP/1.1'
+    router = 'tomtom'
+    api = 'v2'
+    latency = 0.02
+    errorrate = 0.0
+    points = 200
+
+    def log_message(self, *args):
+        pass
+
+    def answer(self, payload, status=200):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path.endswith('/health'):
+            return self.answer({'status': 'ready'})
+        if self.router == 'tomtom':
+            # /routing/1/calculateRoute/{lat},{lon}:{lat},{lon}/json
+            locations = unquote(parts.path).split('/')[-2].split(':')
+            start, end = [[float(value) for value in location.split(',')] for location in locations[:2]]
+        else:
+            # v1 ?coordinates={lon},{lat}|{lon},{lat}
+            locations = parse_qs(parts.query)['coordinates'][0].split('|')
+            start, end = [[float(value) for value in location.split(',')][::-1] for location in locations[:2]]
+        self.route(start, end)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        start, end = [[lat, lon] for lon, lat in body['coordinates'][:2]]
+        self.route(start, end)
+
+    def route(self, start, end):
+        tm.sleep(self.latency)
+        if random.random() < self.errorrate:
+            return self.answer({'error': 'Service Unavailable'}, 503)
+        latitude, longitude, altitude = routeline(start, end, self.points)
+        length = round(float(haversine(start, end)) * 1.3, 1)
+        duration = round(length / 13.9, 1)
+        if self.router == 'tomtom':
+            half = self.points // 2
+            points = [{'latitude': lat, 'longitude': lon} for lat, lon in zip(latitude.tolist(), longitude.tolist())]
+            summary = {'lengthInMeters': int(length), 'travelTimeInSeconds': int(duration),
+                       'trafficDelayInSeconds': 0, 'trafficLengthInMeters': 0,
+                       'departureTime': '2024-01-01T02:00:00+00:00', 'arrivalTime': '2024-01-01T02:30:00+00:00'}
+            payload = {'formatVersion': '0.0.12',
+                       'routes': [{'summary': summary,
+                                   'legs': [{'summary': summary, 'points': points[:half]},
+                                            {'summary': summary, 'points': points[half:]}],
+                                   'sections': [{'startPointIndex': 0, 'endPointIndex': self.points - 1,
+                                                 'sectionType': 'TRAVEL_MODE', 'travelMode': 'car'}]}]}
+        else:
+            coordinates = np.round(np.column_stack([longitude, latitude, altitude]), 6).tolist()
+            properties = {'segments': [{'distance': length, 'duration': duration, 'steps': []}],
+                          'way_points': [0, self.points - 1]}
+            summary = {'distance': length, 'duration': duration}
+            if self.api == 'v1':
+                properties['summary'] = [dict(summary, ascent=12.0, descent=8.0)]
+            else:
+                properties.update({'summary': summary, 'ascent': 12.0, 'descent': 8.0})
+            bbox = [float(longitude.min()), float(latitude.min()), float(longitude.max()), float(latitude.max())]
+            payload = {'type': 'FeatureCollection', 'bbox': bbox,
+                       'features': [{'type': 'Feature', 'bbox': bbox, 'properties': properties,
+                                     'geometry': {'type': 'LineString', 'coordinates': coordinates}}],
+                       'metadata': {'service': 'routing', 'engine': {'version': 'mock'}}}
+        self.answer(payload)
+
+
+class ReusePortServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # the --server-procs processes listen on the same port, the kernel shares the connections
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+def haversine(start, end):
+    lat1, lon1, lat2, lon2 = np.radians([start[0], start[1], end[0], end[1]])
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371008.8 * np.arcsin(np.sqrt(a))
+
+def routeline(start, end, points):
+    """
+        latitude, longitude, altitude arrays of a wavy line from start to end
+    """
+    t = np.linspace(0, 1, max(points, 2))
+    wave = 0.002 * np.sin(t * np.pi * 6)
+    latitude = np.round(start[0] + (end[0] - start[0]) * t + wave, 6)
+    longitude = np.round(start[1] + (end[1] - start[1]) * t - wave, 6)
+    altitude = np.round(50 + 20 * np.sin(t * np.pi * 2), 1)
+    return latitude, longitude, altitude
+
+def servemock(args, ready):
+    """
+        Run a mock server process until it is terminated
+    """
+    MockHandler.router = args.router
+    MockHandler.api = args.api
+    MockHandler.latency = args.latency / 1000.0
+    MockHandler.errorrate = args.error_rate
+    MockHandler.points = args.points
+    server = ReusePortServer(('127.0.0.1', args.port), MockHandler)
+    ready.set()
+    server.serve_forever()
+
+def makeodfile(filename, rows, seed):
+    """
+        Write rows of random start and end coordinates around Montreal in filename
+    """
+    generator = np.random.default_rng(seed)
+    start = generator.uniform([45.40, -73.95], [45.70, -73.45], (rows, 2))
+    end = start + generator.normal(0, 0.05, (rows, 2))
+    df = pd.DataFrame({'id': np.arange(rows), 'start_lat': start[:, 0].round(6), 'start_lon': start[:, 1].round(6),
+                       'end_lat': end[:, 0].round(6), 'end_lon': end[:, 1].round(6)})
+    df.to_csv(filename, index=False)
+
+def resturl(args):
+    if args.router == 'tomtom':
+        return f'http://localhost:{args.port}/routing/1/calculateRoute'
+    if args.api == 'v1':
+        return f'http://localhost:{args.port}/ors/directions'
+    return f'http://localhost:{args.port}/ors/v2/directions'
+
+def runroutes(routeargv, results):
+    """
+        Route the --infile of routeargv with route.routestofile, in a process of its own so that
+        its peak memory is measured alone
+
+        The response hook of the Transport sessions records the latency of each request and
+        parseroute is wrapped to sum its CPU time.
+    """
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import route
+
+    latencies = []
+    parsecpu = [0.0]
+    transports = []
+
+    class TimedTransport(route.Transport):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.session.hooks['response'].append(lambda response, *args, **kwargs:
+                                                  latencies.append(response.elapsed.total_seconds()))
+            transports.append(self)
+
+    parseroute = route.parseroute
+    def timedparseroute(*args, **kwargs):
+        start = tm.thread_time()
+        try:
+            return parseroute(*args, **kwargs)
+        finally:
+            parsecpu[0] += tm.thread_time() - start
+
+    # a warning per route would flood the table, its cost is still measured
+    warnings.simplefilter('ignore')
+    route.Transport = TimedTransport
+    route.parseroute = timedparseroute
+    routeargs = route.Router().parser.parse_args(routeargv)
+    started = tm.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        route.routestofile(routeargs, '')
+    elapsed = tm.perf_counter() - started
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    stats = transports[0].stats if transports else None
+    results.put({'seconds': elapsed, 'requests': stats.get('requests') if stats else len(latencies),
+                 'failures': stats.get('transient failures') if stats else 0,
+                 'p50': float(np.percentile(latencies, 50)) if latencies else float('nan'),
+                 'p99': float(np.percentile(latencies, 99)) if latencies else float('nan'),
+                 'parsecpu': parsecpu[0], 'cpu': own.ru_utime + own.ru_stime,
+                 'childcpu': children.ru_utime + children.ru_stime, 'rss': own.ru_maxrss / 1024.0})
+
+def benchmark(args):
+    """
+        Start the mock servers, then route a synthetic file of each args.rows size and print a line
+        of measures for each
+    """
+    context = multiprocessing.get_context('spawn')
+    workdir = args.workdir or tempfile.mkdtemp(prefix='routebench')
+    os.makedirs(workdir, exist_ok=True)
+    servers = []
+    for number in range(args.server_procs):
+        ready = context.Event()
+        server = context.Process(target=servemock, args=(args, ready), daemon=True)
+        server.start()
+        if not ready.wait(10):
+            print(f'mock server {number} did not start')
+        servers.append(server)
+    print(f'{args.router} {args.api if args.router == "ors" else ""} mock on port {args.port}: {args.latency} ms, '
+          f'{args.error_rate:.1%} errors, {args.points} points per route; route.py {args.route_args}')
+    print(f'{"rows":>9} {"seconds":>9} {"requests":>9} {"errors":>7} {"req/s":>9} {"p50 ms":>8} {"p99 ms":>8} '
+          f'{"parse cpu":>9} {"cpu":>8} {"child cpu":>9} {"rss MB":>8}')
+    try:
+        for rows in args.rows:
+            infile = os.path.join(workdir, f'od{rows}.csv')
+            if not os.path.isfile(infile):
+                makeodfile(infile, rows, args.seed)
+            outfile = os.path.join(workdir, f'routes{rows}.csv')
+            routeargv = ['--route', '--router', args.router, '--resturl', resturl(args), '--infile', infile,
+                         '--outfile', outfile] + args.route_args.split()
+            results = context.Queue()
+            process = context.Process(target=runroutes, args=(routeargv, results))
+            process.start()
+            measures = None
+            while measures is None and process.is_alive():
+                try:
+                    measures = results.get(timeout=1)
+                except queue.Empty:
+                    pass
+            process.join()
+            if measures is None:
+                print(f'{rows:>9} route.py failed, exit code {process.exitcode}')
+                continue
+            print(f'{rows:>9} {measures["seconds"]:>9.2f} {measures["requests"]:>9} {measures["failures"]:>7} '
+                  f'{measures["requests"] / measures["seconds"]:>9.1f} {measures["p50"] * 1000:>8.1f} '
+                  f'{measures["p99"] * 1000:>8.1f} {measures["parsecpu"]:>9.2f} {measures["cpu"]:>8.2f} '
+                  f'{measures["childcpu"]:>9.2f} {measures["rss"]:>8.1f}')
+    finally:
+        for server in servers:
+            server.terminate()
+    print(f'inputs and outputs in {workdir}')
+
+def main():
+    args = Benchmark().parser.parse_args()
+    benchmark(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
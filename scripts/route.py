@@ -1,16 +1,61 @@
-import pandas as pd
-import numpy as np
-import requests 
-from requests.exceptions import HTTPError 
 import sys
 import argparse
 import json
-from io import StringIO
 import os.path
 import datetime
-import geopandas as gpd
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+import urllib.request
+import urllib.error
+import gzip
+import csv
+import sqlite3
+import zlib
+import hashlib
+import heapq
+import xml.etree.ElementTree as ET
+import importlib
+import importlib.util
 import time as tm
-from shapely.geometry import LineString
+import logging
+import bisect
+import itertools
+import contextlib
+import shutil
+import re
+import random
+import threading
+import asyncio
+import copy
+import operator
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+class LazyModule:
+    """
+        Stand-in of a module imported on its first use, then put in its place in the globals
+        
+        pandas, numpy, requests, geopandas and shapely take most of the start up time, and --check
+        or a single summary route (quickroute) need none of them.
+    """
+    def __init__(self, alias, name):
+        self.alias = alias
+        self.name = name
+
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self.name)
+        globals()[self.alias] = module
+        return getattr(module, attribute)
+
+
+pd = LazyModule('pd', 'pandas')
+np = LazyModule('np', 'numpy')
+requests = LazyModule('requests', 'requests')
+gpd = LazyModule('gpd', 'geopandas')
+shapely = LazyModule('shapely', 'shapely')
+pyproj = LazyModule('pyproj', 'pyproj')
+pa = LazyModule('pa', 'pyarrow') # .parquet output only
+pq = LazyModule('pq', 'pyarrow.parquet')
 """
     
     Usage:
@@ -25,8 +70,25 @@ from shapely.geometry import LineString
 """
 
 test = False
+logger = logging.getLogger('route')
+# seconds a tomtom batch download is held by the server while the batch is processed
+batch_wait = 120
+# routes sent at a time to a --parse-procs process
+parse_batch_size = 100
 rest_default_url = {'ors':"https://api.openrouteservice.org/v2/directions",
-                    'tomtom':"https://api.tomtom.com/routing/1/calculateRoute"}
+                    'tomtom':"https://api.tomtom.com/routing/1/calculateRoute",
+                    'ors_matrix':"https://api.openrouteservice.org/v2/matrix",
+                    'tomtom_batch':"https://api.tomtom.com/routing/1/batch/json",
+                    'ors_isochrones':"https://api.openrouteservice.org/v2/isochrones"}
+# hosts of the public services, a --resturl elsewhere is self-hosted: no free plan quota, own api flavour
+public_hosts = ['api.openrouteservice.org', 'api.tomtom.com']
+# http status worth a retry, the request may succeed later
+transient_status = [408, 429, 500, 502, 503, 504]
+# free plan quotas, used when --rate is not set
+rest_default_rate = {'ors':'40/min',
+                     'tomtom':'5/s'}
+# --outfile extension -> format written by ResultWriter
+output_formats = {'.csv':'csv', '.gpkg':'gpkg', '.fgb':'fgb', '.parquet':'parquet', '.geoparquet':'parquet'}
 
 
 class Router:
@@ -36,6 +98,12 @@ class Router:
         group = parser.add_mutually_exclusive_group(required=True)
         group.add_argument('--check', help='display default parameters', action="store_true")
         group.add_argument('--route', help='do the routing', action="store_true")
+        group.add_argument('--isochrone', help='compute the isochrones of --start or of the id,lat,lon --infile rows '
+                           'with --router ors', action="store_true")
+        group.add_argument('--buildgraph', help='build the --graph of --router local from the --osmfile extract',
+                           action="store_true")
+        group.add_argument('--migrate', help='import the --jsondir files of the --infile routes in the sqlite --cachefile',
+                           action="store_true")
 
         parser.add_argument('--start', dest='start', help='lat lon start point', type=float, nargs=2, required=False,
                             default=[49.49331, 5.98375])  # default to esch gare
@@ -46,45 +114,147 @@ class Router:
         parser.add_argument('--summary', help='True: save csv points, False: save route line and summary',
                             action='store_true')
         parser.add_argument('--geometry', help='save line geometry, False: save attributes only', action='store_true')
-        parser.add_argument('--outfile', dest='outfile', help='save routing results to csv|gpkg file', required=False,
+        parser.add_argument('--encode', help='with --summary, save each route line in a column of the summary: '
+                            'polyline, an encoded polyline, or wkb, hex WKB', required=False, default='',
+                            choices=['polyline', 'wkb'])
+        parser.add_argument('--precision', help='decimals of the --encode coordinates', type=int, required=False,
+                            default=5)
+        parser.add_argument('--altitude', help='add the altitudes to the --encode lines, when the router gives them',
+                            action='store_true')
+        parser.add_argument('--simplify', help='simplify the route lines and points with this tolerance in metres '
+                            'before saving them (Douglas-Peucker)', type=float, required=False, default=0)
+        parser.add_argument('--drop-altitude', dest='drop_altitude', help='save the routes without their altitudes',
+                            action='store_true')
+        parser.add_argument('--log-level', dest='log_level', help='messages shown: DEBUG adds a line per row',
+                            required=False, default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+        parser.add_argument('--progress', help='seconds between two progress lines of an --infile run, 0 for none',
+                            type=float, required=False, default=30)
+        parser.add_argument('--metrics', help='file where the --progress lines export the run metrics: Prometheus '
+                            'text, or a JSON line per export if it ends with .jsonl', required=False, default='')
+        parser.add_argument('--outfile', dest='outfile', help='save routing results to a csv, gpkg, fgb or parquet file chosen by the extension', required=False,
                             default='../data/out/route.csv')
-        parser.add_argument('--jsondir', dest='jsondir', help='set json directory to save the details of the routes', required=False, default='../data/out/json')
+        parser.add_argument('--gpkg-copy', dest='gpkg_copy', help='with a .csv --outfile, also save the lines of --summary '
+                            '--geometry or the isochrone polygons in a .gpkg next to it, as before', action='store_true')
+        parser.add_argument('--jsondir', dest='jsondir', help='set json directory to save the details of the routes, '
+                            'a file per id, the rows sharing the same request get a copy of its file', required=False,
+                            default='../data/out/json')
         parser.add_argument('--json', help='load json file if exists, request and save it otherwise',
                             action='store_true')
-        parser.add_argument('--router', dest='router', help='REST routing API', required=False, default='tomtom',
-                            choices=['tomtom', 'ors'])
+        parser.add_argument('--cache', help='where --json keeps the responses: a file per id in --jsondir or a '
+                            'compressed sqlite --cachefile keyed by router, profile, weighting, travelMode and coordinates',
+                            required=False, default='jsondir', choices=['jsondir', 'sqlite'])
+        parser.add_argument('--cachefile', help='sqlite file used by --cache sqlite', required=False,
+                            default='../data/out/routes.sqlite')
+        parser.add_argument('--snap', help='reuse a cached route whose start and end are both within this many metres '
+                            'of the requested ones, needs --json', type=float, required=False, default=0)
+        parser.add_argument('--snap-cell', dest='snap_cell', help='grid cell size in metres of the --snap index, '
+                            'defaults to --snap', type=float, required=False, default=0)
+        parser.add_argument('--router', dest='router', help='REST routing API, or local to route on the --graph',
+                            required=False, default='tomtom', choices=['tomtom', 'ors', 'local'])
+        parser.add_argument('--graph', help='road graph of --router local, saved by --buildgraph', required=False,
+                            default='../data/graph.npz')
+        parser.add_argument('--osmfile', help='OpenStreetMap extract read by --buildgraph, .osm or .osm.pbf',
+                            required=False, default='')
         parser.add_argument('--route_weighting', help='routing weighting criteria', required=False, default='shortest',
                             choices=['shortest', 'fastest'])
-        parser.add_argument('--resturl', help='REST routing custom url', required=False, default='')
+        parser.add_argument('--resturl', help='REST routing custom url, or a comma separated list of urls of servers '
+                            'sharing the load, e.g. http://localhost:8080/ors/v2/directions,http://localhost:8081/ors/v2/directions',
+                            required=False, default='')
+        parser.add_argument('--health-interval', dest='health_interval', help='seconds between two health checks of '
+                            'the --resturl servers', type=float, required=False, default=30.0)
+        parser.add_argument('--max-failures', dest='max_failures', help='consecutive failures before a --resturl '
+                            'server is left out until its next successful health check', type=int, required=False,
+                            default=3)
         parser.add_argument('--api-key', dest='key', help='API-key-file', required=False, default=apikey)
         parser.add_argument('--travelMode', help='Mode of transport', required=False, default="car",
                             choices=['car', 'pedestrian'])
+        parser.add_argument('--workers', help='number of routes requested concurrently with --infile', type=int,
+                            required=False, default=1)
+        parser.add_argument('--matrix', help='with --router ors --summary and no --geometry, get the length and time '
+                            'of the --infile rows from the matrix API, many rows per request', action='store_true')
+        parser.add_argument('--matrix-limit', dest='matrix_limit', help='maximum number of sources x destinations in '
+                            'a matrix request', type=int, required=False, default=3500)
+        parser.add_argument('--batch', help='with --router tomtom, submit the --infile rows to the asynchronous batch '
+                            'routing, --batch-size rows per request', action='store_true')
+        parser.add_argument('--depart-times', dest='depart_times', help='with --router tomtom --infile, route each row '
+                            'at each of these departure times, e.g. 2026-10-20T07:30, or start/end/step sweeps, e.g. '
+                            '2026-10-20T00:00/2026-10-20T23:45/15min, and save id, departAt, travelTimeInSeconds and '
+                            'trafficDelayInSeconds; --chunksize counts the routes of the sweep', nargs='+', required=False,
+                            default=[])
+        parser.add_argument('--batch-size', dest='batch_size', help='number of routes in a tomtom batch, 700 at most',
+                            type=int, required=False, default=700)
+        parser.add_argument('--ranges', help='isochrone range values, seconds for time and metres for distance',
+                            type=float, nargs='+', required=False, default=[300, 600, 900])
+        parser.add_argument('--range-type', dest='range_type', help='isochrone range type', required=False,
+                            default='distance', choices=['time', 'distance'])
+        parser.add_argument('--isochrone-locations', dest='isochrone_locations', help='number of locations sent in an '
+                            'isochrones request, 5 at most for the public api', type=int, required=False, default=5)
+        parser.add_argument('--parse-procs', dest='parse_procs', help='number of processes decoding the responses and '
+                            'building the geometries while the --workers download, 0 to parse in the --workers',
+                            type=int, required=False, default=0)
+        parser.add_argument('--chunksize', help='number of --infile rows read, routed and appended to --outfile at a '
+                            'time', type=int, required=False, default=10000)
+        parser.add_argument('--resume', help='skip the --infile rows already saved according to the --manifest and '
+                            'append to --outfile', action='store_true')
+        parser.add_argument('--incremental', help='route only the --infile rows new or changed since the last complete '
+                            'run on --outfile, according to the fingerprints of its --manifest, keep the other rows of '
+                            '--outfile and drop the ids no longer in --infile', action='store_true')
+        parser.add_argument('--manifest', help='journal of the rows saved by an --infile run, defaults to '
+                            '--outfile.manifest', required=False, default='')
+        parser.add_argument('--round', help='decimals of the coordinates compared to find the --infile rows sharing '
+                            'the same request', type=int, required=False, default=6)
+        parser.add_argument('--pool-size', dest='pool_size', help='maximum number of kept-alive http connections, '
+                            'defaults to max(10, --workers)', type=int, required=False, default=0)
+        parser.add_argument('--timeout', help='http connect and read timeout in seconds', type=float, required=False,
+                            default=60.0)
+        parser.add_argument('--no-keepalive', dest='keepalive', help='close the http connection after each request',
+                            action='store_false')
+        parser.add_argument('--rate', help='maximum request rate shared by all workers e.g. 40/min, 5/s or none, '
+                            'defaults to the free plan of the public service, none for a self-hosted --resturl',
+                            type=ratearg, required=False, default='')
+        parser.add_argument('--burst', help='number of requests allowed at once before --rate applies', type=int,
+                            required=False, default=1)
+        parser.add_argument('--retries', help='maximum number of attempts for a request failing with 429, 5xx or a '
+                            'network error', type=int, required=False, default=4)
+        parser.add_argument('--backoff', help='seconds to wait before the first retry, doubled at each attempt',
+                            type=float, required=False, default=1.0)
+        parser.add_argument('--backoff-max', dest='backoff_max', help='maximum seconds between two attempts',
+                            type=float, required=False, default=60.0)
+        parser.add_argument('--jitter', help='random fraction of the backoff removed from each wait, 0 to 1',
+                            type=float, required=False, default=0.5)
+        parser.add_argument('--retry-budget', dest='retry_budget', help='maximum number of retries for the whole run, '
+                            '-1 for no limit', type=int, required=False, default=1000)
         parser.set_defaults(fonc=handler)
         self.parser = parser
 
 
-def get_data(url):
+def get_data(url, session=None, timeout=None):
     """
         Get a http response to url request 
         
         Arguments
         ---------
             url: url to request with its parameters 
+            session: requests.Session to reuse the connections, module level requests if None
+            timeout: seconds to wait for the server, wait forever if None
         Returns
         -------
             response: can be None
     """
     try:
-        response = requests.get(url)
+        response = (session or requests).get(url, timeout=timeout)
         response.raise_for_status()
-    except HTTPError as http_err:
-        print(f'HTTP error occurred: {http_err}')
+    except requests.exceptions.HTTPError as http_err:
+        logger.debug('HTTP error occurred: %s', http_err)
+    except requests.exceptions.RequestException as err:
+        logger.warning('Network error occurred: %s', err) # Transport.send may retry it
+        raise
     except Exception as err:
-        print(f'Other error occurred: {err}')
+        logger.error('Other error occurred: %s', err)
         raise
     return response
 
-def post_data(url, headers, body):
+def post_data(url, headers, body, session=None, timeout=None):
     """
         Post a http response to url request 
         
@@ -93,640 +263,3635 @@ def post_data(url, headers, body):
             url: url to request with its parameters 
             headers: dict with http headers 
             body: dict with post parameters
+            session: requests.Session to reuse the connections, module level requests if None
+            timeout: seconds to wait for the server, wait forever if None
         Returns
         -------
             response: can be None
     """
     try:
-        response = requests.post(url, json=body, headers=headers)
+        response = (session or requests).post(url, json=body, headers=headers, timeout=timeout)
         response.raise_for_status()
-    except HTTPError as http_err:
-        print(f'HTTP POST error occurred: {http_err}')
+    except requests.exceptions.HTTPError as http_err:
+        logger.debug('HTTP POST error occurred: %s', http_err)
+    except requests.exceptions.RequestException as err:
+        logger.warning('Network POST error occurred: %s', err) # Transport.send may retry it
+        raise
     except Exception as err:
-        print(f'Other POST error occurred: {err}')
+        logger.error('Other POST error occurred: %s', err)
         raise
     return response
 
-def isochronesfromfile(args, key):
+class UrlResponse:
     """
-        Download the routing results from REST router accordingly to the lat/lon coords from args.infile
-        
-        args.infile is a csv file and MUST contain a header with the following:
-            id, lat,lon
+        Status, reason, headers and text of a urllib response, read as a requests response
+    """
+    def __init__(self, status_code, reason, headers, text):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.text = text
+
+
+def urlsend(method, url, body=None, headers=None, timeout=None):
+    """
+        Send a http request with urllib, for quickroute that does not import requests
         
         Arguments
         ---------
-            args    : from argparse
-            key     : api key value
+            method  : 'GET' or 'POST'
+            url     : url to request with its parameters
+            body    : dict with post parameters, sent as json
+            headers : dict with http headers
+            timeout : seconds to wait for the server, wait forever if None
         Returns
         -------
-            DataFrame with route points if args.summary is True, GeoDataFrame with route line and summary otherwise
+            UrlResponse: None if the network failed
     """
-    if args.summary:
-        df = pd.DataFrame()
-    else:
-        df = gpd.GeoDataFrame()
-    if args.infile:
-        inreq = pd.read_csv(args.infile, dtype={'id':'str'})
-        inreq.info()
-        print(f'read {args.infile}: {len(inreq.index)} lines')
-        for index, row in inreq.iterrows():
-            print(f'row id {row["id"]} lat {row["lat"]}')
-            dfisochrone = isochronefinder(args, [row['lat'],row['lon']], row['id'], key)
-            if not dfisochrone.empty:
-                df = pd.concat([df, dfisochrone],sort=False)
-    return df
-
+    headers = {'Accept-Encoding': 'gzip', **(headers or {})}
+    data = None
+    if method == 'POST':
+        data = json.dumps(body).encode('utf-8')
+        headers.setdefault('Content-Type', 'application/json; charset=utf-8')
+    request = urllib.request.Request(url, data=data, headers=headers, method=method)
+    try:
+        try:
+            response = urllib.request.urlopen(request, timeout=timeout)
+        except urllib.error.HTTPError as http_err:
+            logger.debug('HTTP error occurred: %s', http_err)
+            response = http_err
+        with response:
+            content = response.read()
+            if response.headers.get('Content-Encoding') == 'gzip':
+                content = gzip.decompress(content)
+            return UrlResponse(response.status, response.reason, response.headers,
+                               content.decode(response.headers.get_content_charset() or 'utf-8'))
+    except (urllib.error.URLError, OSError) as err:
+        logger.debug('network error occurred: %s', err)
+        return None
 
-def isochronefinder(args, coords, ranges, id, key):
+def orsapi(args):
     """
-        Downloads the isochrones results from REST router accordingly to the start, end arguments
-            
+        Flavour of the openrouteservice API behind args.resturl
+        
         Arguments
         ---------
             args    : from argparse
-            coords   : array with  lat lon
-            ranges   : Maximum range value of the analysis in seconds for time and metres for distance.Alternatively a comma separated list of specific single range values if more than one location is set
-            id      : str to identify the route
-            key     : api key value
         Returns
         -------
-            DataFrame: with isochrones geometry if args.summary is True, GeoDataFrame with isochrone area and summary otherwise
+            str: 'v1' or 'v2' for a self-hosted server, 'public' otherwise
     """
-    pyisochrone = []
-    df= pd.DataFrame()
-    #key = getApiKey(args)
-    if args.router=='ors':
-        # default free flow drive
-        
-        '''
-            import requests
-        
-            body = {"locations":[[5.886453,49.532905]],"range":[800,1000],"range_type":"distance","area_units":"km","units":"m"}
-        
-            headers = {
-                'Accept': 'application/json, application/geo+json, application/gpx+xml, img/png; charset=utf-8',
-                'Authorization': 'your-api-key',
-                'Content-Type': 'application/json; charset=utf-8'
-            }
-            call = requests.post('https://api.openrouteservice.org/v2/isochrones/driving-car', json=body, headers=headers)
-
-            print(call.status_code, call.reason)
-            print(call.text)
-        '''
-        headers = {
-            'Accept': 'application/json, application/geo+json, application/gpx+xml, img/png; charset=utf-8','Authorization': key, 'Content-Type': 'application/json; charset=utf-8'
-        }
-        baseurl = rest_default_url["ors"]
-        if len(args.resturl)>0:
-            baseurl = args.resturl
-            url = f'{baseurl}/driving-car/geojson'
-            if args.travelMode=='pedestrian':
-                url = f'{baseurl}/foot-walking/geojson'
-            if "localhost" in args.resturl: # non V2 API support http://localhost:8080/ors/directions
-                profile='driving-car'
-                if args.travelMode=='pedestrian':
-                    profile='foot-walking'
-                url = f'{baseurl}?locations={coords[1]},{coords[0]}&range={",".join(map(str,ranges))}&format=geojson&preference=shortest'
-        body = {"locations":[[coords[1],coords[0]]], "range":ranges,"id":id, "range_type":"distance","units":"m"}
-        if args.json:
-            #check if args.jsondir/{id}.json is present otherwise do request
-            if os.path.isfile(f'{args.jsondir}/{id}.json'):
-                print(f'\tread ors {args.jsondir}/{id}.json')
-                with open(f'{args.jsondir}/{id}.json', 'r') as file:
-                    data = file.read().replace('\n', '')
-                    if data!="null":
-                        pyisochrone = json.load(StringIO(data))
-            else:
-                response = post_data(url, headers, body)
-                # if (len(args.resturl)>0) & ("localhost" in args.resturl):
-                    # print(f'\tGET {url}')
-                    # response = get_data(url)
-                # else:
-                    # response = post_data(url, headers, body)
-                    #tm.sleep(2) # OpenRouteService does not support more than 40 requests in a minute, lets try with a 2s sleep
-                print(response.status_code, response.reason)
-                print(f'\tors request |save json')
-                pyisochrone = getJSONResponse(response, id)
-                # save json for later
-                writeJSONResponse(args,pyisochrone,id)
-        else:
-            if test:
-                with open('U:/Projets/2018_CURHA_GPS/data/walk/ors/example.geojson', 'r') as file:
-                    data = file.read().replace('\n', '')
-                    pyisochrone = json.load(StringIO(data))
-            else:
-                if (len(args.resturl)>0) & ("localhost" in args.resturl):
-                    response = get_data(url)
-                else:
-                    response = post_data(url, headers, body)
-                print(f'ors request')
-                pyisochrone = getJSONResponse(response, id)
-    
-    else:
-        print (f'router.py does not support the router {args.router}')
-    df = getisochroneinfo(args, pyisochrone,id)
-    # if args.summary:
-        # #print(f'route info output  implemented  for {args.router}')
-        # df = getisochroneinfo(args, pyisochrone,id)
-    # else:
-        # #print(f'route points output  implemented  for {args.router}')
-        # df = getisochronegeometry(args, pyisochrone,id)
-    return df
+    if selfhosted(args):
+        if "v2" in args.resturl:
+            return 'v2'
+        return 'v1'
+    return 'public'
 
-def routesfromfile(args, key):
+def selfhosted(args):
     """
-        Download the routing results from REST router accordingly to the start/end coords from args.infile
-        
-        args.infile is a csv file and MUST contain a header with the following:
-            id, start_lat, start_lon, end_lat, end_lon
+        Tell if args.resturl points to servers of our own rather than the public services
         
         Arguments
         ---------
             args    : from argparse
-            key     : api key value
         Returns
         -------
-            DataFrame with route points if args.summary is True, GeoDataFrame with route line and summary otherwise
+            bool: True if a --resturl is given and one of its hosts is not in public_hosts
     """
-    if args.summary:
-        df = pd.DataFrame()
-    else:
-        df = gpd.GeoDataFrame()
-    if args.infile:
-        inreq = pd.read_csv(args.infile, dtype={'id':'str'})
-        inreq.info()
-        print(f'read {args.infile}: {len(inreq.index)} lines')
-        for index, row in inreq.iterrows():
-            print(f'row id {row["id"]} start_lat {row["start_lat"]}')
-            dfroute = routefinder(args, [row['start_lat'],row['start_lon']], [row['end_lat'],row['end_lon']], row['id'], key)
-            if not dfroute.empty:
-                df = pd.concat([df, dfroute],sort=False)
-    return df
+    hosts = [urlsplit(url.strip()).hostname for url in args.resturl.split(',') if url.strip()]
+    return any(host not in public_hosts for host in hosts)
 
-def routefinder(args, start, end, id, key):
+
+def parserate(rate):
     """
-        Downloads the routing results from REST router accordingly to the start, end arguments
-            
+        Parse a request rate
+        
         Arguments
         ---------
-            args    : from argparse
-            start   : array with  lat lon
-            end     : array with  lat lon
-            id      : str to identify the route
-            key     : api key value
+            rate    : str like 40/min, 5/s, 1000/hour or none
         Returns
         -------
-            DataFrame: with route points if args.summary is True, GeoDataFrame with route line and summary otherwise
+            float: requests per second, None if the rate is unlimited
     """
-    pyroute = []
-    df= pd.DataFrame()
-    #key = getApiKey(args)
-    if args.router == 'tomtom':
-        time = tomorrow2am()
-        baseurl = rest_default_url["tomtom"]
-        if len(args.resturl)>0:
-            baseurl = args.resturl
-        url = f'{baseurl}/{start[0]},{start[1]}:{end[0]},{end[1]}/json?avoid=unpavedRoads&routeType={args.route_weighting}&traffic=true&travelMode=car&key={key}&departAt={time}&travelMode={args.travelMode}'
-        
-        if args.json:
-            #check if args.jsondir/{id}.json is present otherwise do request
-            if os.path.isfile(f'{args.jsondir}/{id}.json'):
-                with open(f'{args.jsondir}/{id}.json', 'r') as file:
-                    data = file.read().replace('\n', '')
-                    if data!="null":
-                        pyroute = json.load(StringIO(data))
-            else:
-                response = get_data(url)
-                pyroute = getJSONResponse(response, id)
-                # save json for later
-                writeJSONResponse(args,pyroute,id)
-        else:
-            if test:
-                with open('U:\\temp\\route.json', 'r') as file:
-                    data = file.read().replace('\n', '')
-                    pyroute = json.load(StringIO(data))
-            else:
-                response = get_data(url)
-                pyroute = getJSONResponse(response, id)
-    elif args.router == 'ors':
-        # default free flow drive
-        
-        '''
-            this gives a detailed geometry:
-            
-            import requests
+    if rate.lower() in ['', 'none', '0']:
+        return None
+    count, _, unit = rate.partition('/')
+    seconds = {'': 1, 's': 1, 'sec': 1, 'second': 1, 'min': 60, 'minute': 60, 'h': 3600, 'hour': 3600,
+               'day': 86400}
+    if unit.lower() not in seconds:
+        raise ValueError(f'unknown rate unit in {rate}')
+    return float(count) / seconds[unit.lower()]
 
-            body = {"coordinates":[[8.681495,49.41461],[8.686507,49.41943],[8.687872,49.420318]],"elevation":"true","id":101,"instructions":"true","maneuvers":"true","preference":"fastest","units":"m"}
+def ratearg(rate):
+    """
+        argparse type of --rate: the rate as given, once parserate can read it
+    """
+    try:
+        parserate(rate)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{rate} is not a rate like 40/min, 5/s or none')
+    return rate
 
-            headers = {
-                'Accept': 'application/json, application/geo+json, application/gpx+xml, img/png; charset=utf-8',
-                'Authorization': '5b3ce3597851110001cf62489e097ebf8805476a839f24b83345cc4e',
-                'Content-Type': 'application/json; charset=utf-8'
-            }
-            call = requests.post('https://api.openrouteservice.org/v2/directions/foot-walking/geojson', json=body, headers=headers)
-
-            print(call.status_code, call.reason)
-            print(call.text)
-        '''
-        headers = {
-            'Accept': 'application/json, application/geo+json, application/gpx+xml, img/png; charset=utf-8',
-            'Authorization': key, 'Content-Type': 'application/json; charset=utf-8 '
-        }
-        baseurl = rest_default_url["ors"]
-        body = {"coordinates": [[start[1], start[0]], [end[1], end[0]]], "elevation": "true",
-                "id": id, "instructions": "false", "maneuvers": "false", "preference": args.route_weighting,
-                "units": "m"}
-        if len(args.resturl)>0:
-            baseurl = args.resturl
-            url = f'{baseurl}/driving-car/geojson'
-            if args.travelMode=='pedestrian':
-                url = f'{baseurl}/foot-walking/geojson'
-            if "localhost" in args.resturl:
-                profile='driving-car'
-                if args.travelMode=='pedestrian':
-                    profile='foot-walking'
-                if "v2" in args.resturl:
-                    url = f'{baseurl}/{profile}/geojson'
-                    body = {"coordinates": [[start[1], start[0]], [end[1], end[0]]],
-                            "elevation": "true", "id": id, "instructions": "false", "maneuvers": "false",
-                            "preference": args.route_weighting, "units": "m"}
-                else: # non V2 API support http://localhost:8080/ors/directions
-                    url = f'{baseurl}?coordinates={start[1]},{start[0]}|{end[1]},{end[0]}&profile={profile}&format' \
-                      f'=geojson&elevation=true&preference={args.route_weighting}'
+class RateLimiter:
+    """
+        Token bucket shared by the threads of a run
+        
+        Tokens are refilled at rate per second up to burst; acquire() blocks until a token
+        is available. update() reads the Retry-After and x-ratelimit-* response headers and
+        holds every thread back until the service quota is reset.
+    """
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = tm.monotonic()
+        self.pauseuntil = 0.0
+        self.lock = threading.Lock()
 
-        if args.json:
-            #check if args.jsondir/{id}.json is present otherwise do request
-            if os.path.isfile(f'{args.jsondir}/{id}.json'):
-                print(f'\tread ors {args.jsondir}/{id}.json')
-                with open(f'{args.jsondir}/{id}.json', 'r') as file:
-                    data = file.read().replace('\n', '')
-                    if data!="null":
-                        pyroute = json.load(StringIO(data))
-            else:
-                if (len(args.resturl)>0) & ("localhost" in args.resturl) & ('v2' not in args.resturl):
-                    print(f'\tGET {url}')
-                    response = get_data(url)
-                elif (len(args.resturl)>0) & ("localhost" in args.resturl) & ('v2' in args.resturl):
-                    print(f'\tPOST {url} and {body}')
-                    response = post_data(url, headers, body)
-                else:
-                    response = post_data(url, headers, body)
-                    tm.sleep(2) # OpenRouteService does not support more than 40 requests in a minute, lets try with a 2s sleep
-                print(response.status_code, response.reason)
-                print(f'\tors request |save json')
-                pyroute = getJSONResponse(response, id)
-                # save json for later
-                writeJSONResponse(args,pyroute,id)
-        else:
-            if test:
-                with open('U:/Projets/2018_CURHA_GPS/data/walk/ors/example.geojson', 'r') as file:
-                    data = file.read().replace('\n', '')
-                    pyroute = json.load(StringIO(data))
-            else:
-                if (len(args.resturl) > 0) & ("localhost" in args.resturl) & ('v2' not in args.resturl):
-                    print(f'\tGET {url}')
-                    response = get_data(url)
-                elif (len(args.resturl) > 0) & ("localhost" in args.resturl) & ('v2' in args.resturl):
-                    print(f'\tPOST {url} and {body}')
-                    response = post_data(url, headers, body)
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = tm.monotonic()
+                if self.rate:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now < self.pauseuntil:
+                    wait = self.pauseuntil - now
+                elif not self.rate:
+                    return
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
                 else:
-                    response = post_data(url, headers, body)
-                print(f'ors request')
-                pyroute = getJSONResponse(response, id)
+                    wait = (1 - self.tokens) / self.rate
+            tm.sleep(wait)
 
-    else:
-        print (f'router.py does not support the router {args.router}')
-    
-    if args.summary:
-        #print(f'route info output  implemented  for {args.router}')
-        df = getrouteinfo(args, pyroute,id)
-    else:
-        #print(f'route points output  implemented  for {args.router}')
-        df = getroutepoints(args, pyroute,id)
-    return df
+    def pause(self, seconds):
+        """
+            Hold every request back for seconds and drop the tokens refilled so far
+        """
+        with self.lock:
+            self.pauseuntil = max(self.pauseuntil, tm.monotonic() + seconds)
+            self.tokens = 0.0
 
-def writeJSONResponse(args,pyroute,id):
+    def update(self, response):
+        """
+            Adjust the pace to the quota announced by the response headers
+            
+            Arguments
+            ---------
+                response: the response, can be None
+        """
+        if response is None:
+            return
+        seconds = retryafterseconds(response.headers.get('Retry-After'))
+        if seconds is not None:
+            self.pause(max(0.0, seconds))
+        elif response.headers.get('x-ratelimit-remaining') == '0':
+            # x-ratelimit-reset is an epoch time for openrouteservice, a delay for others
+            reset = retryafterseconds(response.headers.get('x-ratelimit-reset'))
+            if reset is None:
+                reset = 60.0
+            elif reset > 1e9:
+                reset -= tm.time()
+            self.pause(max(0.0, reset))
+        elif response.status_code == 429:
+            self.pause(1 / self.rate if self.rate else 1.0)
+
+
+def retryafterseconds(retryafter):
     """
-        write the JSON structure in args.jsondir/id.json 
+        Seconds to wait according to a Retry-After or x-ratelimit-reset header
         
         Arguments
         ---------
-            args    : from argparse
-            pyroute : python representation of the json structure
-            id      : integer to identify the route
+            retryafter : header value, seconds or an HTTP-date, can be None
+        Returns
+        -------
+            float: None if there is no header or it can not be read, the usual backoff applies then
     """
-    file = open(f'{args.jsondir}/{id}.json', 'w')
-    file.write(json.dumps(pyroute))
-    file.close()
-    
-def getJSONResponse(response,id):
+    if not retryafter:
+        return None
+    try:
+        return float(retryafter)
+    except ValueError:
+        pass
+    try:
+        return (parsedate_to_datetime(retryafter) - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+    except (TypeError, ValueError):
+        # malformed date, or a date without time zone that can not be compared
+        logger.debug('unreadable rate limit header: %s', retryafter)
+        return None
+
+
+def isretryable(err):
     """
-        Get the JSON response 
+        Tell if a requests exception may not happen again, i.e. it is not an error of the request itself
         
         Arguments
         ---------
-            response: the response
-            id      : str to identify the route
+            err     : exception raised by requests
         Returns
         -------
-            python object: corresponding to the json decoding
+            bool: True for the network and transfer errors (ConnectionError, Timeout,
+                  ChunkedEncodingError, ContentDecodingError...), False for an invalid url,
+                  header or body
     """
-    pyroute = None
-    if response.status_code == requests.codes.ok:
-        pyroute = json.load(StringIO(response.text))
-    else:
-        print(f'\t{id} : response code is {response.status_code}')
-    return pyroute
+    exceptions = requests.exceptions
+    clienterrors = (exceptions.URLRequired, exceptions.MissingSchema, exceptions.InvalidSchema,
+                    exceptions.InvalidURL, exceptions.InvalidHeader, exceptions.InvalidJSONError,
+                    exceptions.TooManyRedirects)
+    return isinstance(err, exceptions.RequestException) and not isinstance(err, clienterrors)
 
 
-def getisochroneinfo(args,pyisochrone,id):
+def istransient(response):
     """
-        Process the python structure to retrieve the route summary info such as duration, distance etc.
+        Tell if a failed request may succeed later
         
         Arguments
         ---------
-            args    : from argparse
-            pyroute  : python object: corresponding to the json decoding
-            id      : integer to identify the route
+            response: the response, None after a network error
         Returns
         -------
-            GeoDataFrame: summary with a line geometry
+            bool: True if response is None or its status is in transient_status
     """
-    results = gpd.GeoDataFrame()
-    try:
-        points = getisochronegeometry(args,pyisochrone,id)
-        if not points.empty:
-            d = {'id':id}
-            results = pd.DataFrame(d, index=[0])
-            if args.geometry:
-                geometry = gpd.points_from_xy(points.longitude, points.latitude)
-                points = gpd.GeoDataFrame(points, geometry=geometry) # points is now a GeoDataFrame
-                s = points.groupby(['id'])['geometry'].apply(lambda x: LineString(x.tolist()))
-                d = {'id':s.index, 'geometry':s.values}
-                results = gpd.GeoDataFrame(d,geometry=d['geometry'])
-                results.crs = {'init':'epsg:4326'}
-            if pyisochrone:
-                if type(pyisochrone) is dict: 
-                    if args.router=='ors':
-                        if "features" in pyisochrone:
-                            if (len(args.resturl)>0) & ("localhost" in args.resturl):
-                                summary = pyisochrone["features"][0]["properties"]["summary"][0]
-                                results["lengthInMeters"] = summary["distance"]
-                                results["travelTimeInSeconds"] = summary["duration"]
-                                if "descent" in summary :
-                                    results["descent"] = summary["descent"]
-                                if "ascent" in summary:
-                                    results["ascent"] = summary["ascent"]
-                            else:
-                                summary = pyisochrone["features"][0]["properties"]["summary"]
-                                results["lengthInMeters"] = summary["distance"]
-                                results["travelTimeInSeconds"] = summary["duration"]
-                                results["descent"] = pyisochrone["features"][0]["properties"]["descent"]
-                                results["ascent"] = pyisochrone["features"][0]["properties"]["ascent"]                        
-                    else:
-                        print(f'unknown router {args.router}')
-    except Exception as err:
-        print(f'Other error occurred in {id}: {err}')
-        raise
-    return results
+    return response is None or response.status_code in transient_status
 
 
-def getisochronegeometry(args,pyisochrone,id):
+class RetryPolicy:
+    """
+        Exponential backoff with jitter, bounded by a retry budget shared by the threads of a run
+    """
+    def __init__(self, attempts=4, backoff=1.0, backoffmax=60.0, jitter=0.5, budget=1000):
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.backoffmax = backoffmax
+        self.jitter = min(1.0, max(0.0, jitter))
+        self.budget = budget
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def delay(self, attempt):
+        """
+            Seconds to wait after the failed attempt (0 based)
+        """
+        delay = min(self.backoffmax, self.backoff * 2 ** attempt)
+        return delay * (1 - self.jitter * random.random())
+
+    def spend(self):
+        """
+            Take a retry from the budget
+            
+            Returns
+            -------
+                bool: False if the budget is exhausted
+        """
+        with self.lock:
+            if 0 <= self.budget <= self.used:
+                return False
+            self.used += 1
+            return True
+
+
+class BackendPool:
     """
-        Process the python structure to retrieve the isochrones
+        Several servers with the same api sharing the requests of a run
         
-        Arguments
-        ---------
-            args    : from argparse
-            pyisochrone : python object: corresponding to the json decoding
-            id      : str to identify the isochrones
-        Returns
-        -------
-            DataFrame:  a succession of coordinates of the route
-                        id,geometry
+        Each request goes to the server with the fewest requests in progress. A server failing
+        max_failures times in a row, or failing its health check, is ejected; a thread checks the
+        health of every server each interval seconds and brings the ejected ones back once they
+        answer again.
     """
-    df = pd.DataFrame()
-    latitude = []
-    longitude = []
-    sequence = []
-    seq = 0
-    try:
-        if pyisochrone:
-            if(args.router=='ors'):
-                print('todo: code it')
-            elif(args.router=='ors'):
-                if type(pyisochrone) is dict: 
-                    if "features" in pyisochrone:
-                        altitude = []
-                        for point in pyisochrone["features"][0]["geometry"]["coordinates"]:
-                            seq += 1
-                            longitude.append(point[0])
-                            latitude.append(point[1])
-                            altitude.append(point[2])
-                            sequence.append(seq)
-                        df = pd.DataFrame({'id':id, 'latitude': latitude, 'longitude':longitude,'altitude':altitude,'seq':sequence})
-                        print(f'\t{id}: points count: {len(df.index)}')
+    def __init__(self, urls, session, maxfailures=3, interval=30.0, timeout=5.0):
+        self.backends = [{'url': url, 'netloc': urlsplit(url).netloc, 'outstanding': 0, 'failures': 0,
+                          'ejected': False} for url in urls]
+        self.session = session
+        self.maxfailures = maxfailures
+        self.interval = interval
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.healthcheck()
+        self.monitor = threading.Thread(target=self.watch, daemon=True)
+        self.monitor.start()
+
+    def healthurl(self, backend):
+        # http://host:8080/ors/v2/directions -> http://host:8080/ors/v2/health
+        return backend['url'].rsplit('/', 1)[0] + '/health'
+
+    def healthcheck(self):
+        for backend in self.backends:
+            try:
+                healthy = self.session.get(self.healthurl(backend), timeout=self.timeout).status_code == requests.codes.ok
+            except requests.exceptions.RequestException:
+                healthy = False
+            with self.lock:
+                if healthy and backend['ejected']:
+                    logger.info(f'{backend["netloc"]} is back')
+                elif not healthy and not backend['ejected']:
+                    logger.warning(f'{backend["netloc"]} failed its health check, ejected')
+                backend['ejected'] = not healthy
+                if healthy:
+                    backend['failures'] = 0
+
+    def watch(self):
+        while not self.stopped.wait(self.interval):
+            self.healthcheck()
+
+    def acquire(self):
+        """
+            Returns
+            -------
+                dict: the backend to send the next request to
+        """
+        with self.lock:
+            candidates = [backend for backend in self.backends if not backend['ejected']] or self.backends
+            backend = min(candidates, key=lambda backend: backend['outstanding'])
+            backend['outstanding'] += 1
+            return backend
+
+    def release(self, backend, response):
+        with self.lock:
+            backend['outstanding'] -= 1
+            if response is None or response.status_code >= 500:
+                backend['failures'] += 1
+                if backend['failures'] >= self.maxfailures and not backend['ejected']:
+                    logger.warning(f'{backend["netloc"]} failed {backend["failures"]} times, ejected')
+                    backend['ejected'] = True
             else:
-                print(f'unknown router {args.router}')
-    except Exception as err:
-        print(f'Other error occurred: {err}')
-        raise
-    return df
+                backend['failures'] = 0
 
-def getrouteinfo(args,pyroute,id):
+    def url(self, backend, url):
+        """
+            url sent to backend instead of the first server
+        """
+        parts = urlsplit(url)
+        return urlunsplit((parts.scheme, backend['netloc'], parts.path, parts.query, parts.fragment))
+
+    def close(self):
+        self.stopped.set()
+
+
+class RequestTemplates:
     """
-        Process the python structure to retrieve the route summary info such as duration, distance etc.
+        Urls, headers and bodies of the requests of a run
         
-        Arguments
-        ---------
-            args    : from argparse
-            pyroute  : python object: corresponding to the json decoding
-            id      : integer to identify the route
-        Returns
-        -------
-            GeoDataFrame: summary with a line geometry
+        The headers, base url, profile and departure time are built once, so that a route
+        only costs its http exchange. Plain python, quickroute uses them without requests.
     """
-    results = gpd.GeoDataFrame()
-    try:
-        points = getroutepoints(args,pyroute,id)
-        if not points.empty:
-            d = {'id':id}
-            results = pd.DataFrame(d, index=[0])
-            if args.geometry:
-                geometry = gpd.points_from_xy(points.longitude, points.latitude)
-                points = gpd.GeoDataFrame(points, geometry=geometry) # points is now a GeoDataFrame
-                if len(points) > 1:
-                    s = points.groupby(['id'])['geometry'].apply(lambda x: LineString(x.tolist()))
-                    d = {'id':s.index, 'geometry':s.values}
+    def __init__(self, args, key):
+        self.router = args.router
+        self.weighting = args.route_weighting
+        self.baseurl = rest_default_url[args.router] if args.router in rest_default_url else ''
+        self.resturls = [url.strip() for url in args.resturl.split(',') if url.strip()]
+        if self.resturls:
+            # the urls are built for the first server and sent to the others with their host and port
+            self.baseurl = self.resturls[0]
+        if args.router == 'tomtom':
+            self.key = key
+            self.departAt = tomorrow2am()
+            self.url = f'{self.baseurl}/{{start}}:{{end}}/json?avoid=unpavedRoads&routeType={args.route_weighting}' \
+                       f'&traffic=true&travelMode=car&key={key}&departAt={{departAt}}&travelMode={args.travelMode}'
+            # batch items are the url path and parameters after /routing/1, without the key
+            if args.depart_times:
+                # the sweep only keeps the summary, the points are not worth downloading
+                self.url += '&routeRepresentation=summaryOnly'
+            self.batchquery = '/calculateRoute' + self.url[len(self.baseurl):].replace(f'&key={key}', '')
+            self.batchurl = rest_default_url['tomtom_batch']
+            if len(args.resturl)>0:
+                self.batchurl = self.baseurl.replace('calculateRoute', 'batch/json')
+        elif args.router == 'ors':
+            self.api = orsapi(args)
+            self.profile = 'driving-car'
+            if args.travelMode=='pedestrian':
+                self.profile = 'foot-walking'
+            self.headers = {
+                'Accept': 'application/json, application/geo+json, application/gpx+xml, img/png; charset=utf-8',
+                'Authorization': key, 'Content-Type': 'application/json; charset=utf-8 '
+            }
+            self.url = f'{self.baseurl}/{self.profile}/geojson'
+            if self.api == 'v1': # non V2 API support http://localhost:8080/ors/directions
+                self.url = f'{self.baseurl}?coordinates={{start}}|{{end}}&profile={self.profile}&format' \
+                           f'=geojson&elevation=true&preference={args.route_weighting}'
+            matrixurl = rest_default_url['ors_matrix']
+            if len(args.resturl)>0:
+                matrixurl = self.baseurl.replace('directions', 'matrix')
+            self.matrixurl = f'{matrixurl}/{self.profile}'
+            isochroneurl = rest_default_url['ors_isochrones']
+            if len(args.resturl)>0:
+                isochroneurl = self.baseurl.replace('directions', 'isochrones')
+            self.isochroneurl = f'{isochroneurl}/{self.profile}'
+            if self.api == 'v1': # non V2 API support http://localhost:8080/ors/isochrones
+                self.isochroneurl = f'{isochroneurl}?locations={{locations}}&range={{ranges}}&profile={self.profile}' \
+                                    f'&range_type={args.range_type}&attributes=area&units=m'
+
+    def routerequest(self, start, end, id, departAt=None):
+        """
+            Request of the route from start to end
+            
+            Arguments
+            ---------
+                start   : array with  lat lon
+                end     : array with  lat lon
+                id      : str to identify the route
+                departAt : tomtom departure time, tomorrow 2 am if None
+            Returns
+            -------
+                tuple: method, url, body and headers of the request
+        """
+        if self.router == 'tomtom':
+            return 'GET', self.url.format(start=f'{start[0]},{start[1]}', end=f'{end[0]},{end[1]}',
+                                          departAt=departAt or self.departAt), None, None
+        if self.api == 'v1':
+            url = self.url.format(start=f'{start[1]},{start[0]}', end=f'{end[1]},{end[0]}')
+            logger.debug('\tGET %s', url)
+            return 'GET', url, None, None
+        body = {"coordinates": [[start[1], start[0]], [end[1], end[0]]], "elevation": "true",
+                "id": id, "instructions": "false", "maneuvers": "false", "preference": self.weighting,
+                "units": "m"}
+        if self.api == 'v2':
+            logger.debug('\tPOST %s and %s', self.url, body)
+        return 'POST', self.url, body, self.headers
+
+
+class Transport(RequestTemplates):
+    """
+        Pooled http session and request templates shared by all the routes of a run
+        
+        requests.Session is safe to share between the --workers threads as long as the pool
+        is large enough to hold a connection per thread.
+    """
+    def __init__(self, args, key, stats=None):
+        super().__init__(args, key)
+        self.timeout = args.timeout
+        poolsize = args.pool_size or max(10, args.workers)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=poolsize, pool_maxsize=poolsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate',
+                                     'Connection': 'keep-alive' if args.keepalive else 'close'})
+        rate = args.rate or rest_default_rate.get(args.router, '')
+        self.backends = None
+        if len(self.resturls) > 1:
+            self.backends = BackendPool(self.resturls, self.session, args.max_failures, args.health_interval,
+                                        args.timeout)
+        if selfhosted(args):
+            rate = args.rate # self-hosted servers are not throttled unless asked for
+        self.limiter = RateLimiter(parserate(rate), args.burst)
+        self.retry = RetryPolicy(args.retries, args.backoff, args.backoff_max, args.jitter, args.retry_budget)
+        self.stats = stats or RunStats()
+
+    def send(self, method, url, body=None, headers=None, id='', endpoint='route', timeout=None):
+        """
+            Send a request through the rate limiter, retrying the transient failures
+            
+            Arguments
+            ---------
+                method  : 'GET' or 'POST'
+                url     : url to request with its parameters
+                body    : dict with post parameters
+                headers : dict with http headers
+                id      : str to identify the request in the messages
+                endpoint : label of the request latency metric
+                timeout : seconds or (connect, read) seconds, args.timeout if None
+            Returns
+            -------
+                response: None if the network failed for every attempt
+        """
+        for attempt in range(self.retry.attempts):
+            self.limiter.acquire()
+            self.stats.add('requests')
+            backend = None
+            sendurl = url
+            if self.backends is not None:
+                backend = self.backends.acquire()
+                sendurl = self.backends.url(backend, url)
+                self.stats.add('backend requests', backend=backend["netloc"])
+            response = None
+            self.stats.gauge('in flight', 1)
+            started = tm.perf_counter()
+            try:
+                if method == 'GET':
+                    response = get_data(sendurl, self.session, timeout or self.timeout)
                 else:
-                    d = {'id':points['id'], 'geometry':None}
-                results = gpd.GeoDataFrame(d,geometry=d['geometry'])
-                results.crs = {'init':'epsg:4326'}
-            if pyroute:
-                if type(pyroute) is dict: 
-                    if args.router=='tomtom':
-                        if "routes" in pyroute:
-                            summary = pyroute["routes"][0]["summary"]
-                            results["lengthInMeters"] = summary["lengthInMeters"]
-                            results["travelTimeInSeconds"] = summary["travelTimeInSeconds"]
-                    elif args.router == 'ors':
-                        if "features" in pyroute:
-                            if (len(args.resturl)>0) & ("localhost" in args.resturl):
-                                if "v2" in args.resturl:
-                                    summary = pyroute["features"][0]["properties"]["summary"]
-                                else:
-                                    summary = pyroute["features"][0]["properties"]["summary"][0]
-                                if 'distance' in summary:
-                                    results["lengthInMeters"] = summary["distance"]
-                                else:
-                                    results["lengthInMeters"] = 0.0
-                                if 'duration' in summary:
-                                    results["travelTimeInSeconds"] = summary["duration"]
-                                else:
-                                    results["travelTimeInSeconds"] = 0.0
-                                if "descent" in summary :
-                                    results["descent"] = summary["descent"]
-                                # else:
-                                    # results["descent"] = None
-                                if "ascent" in summary:
-                                    results["ascent"] = summary["ascent"]
-                                # else:
-                                    # results["ascent"] = None
-                            else:
-                                summary = pyroute["features"][0]["properties"]["summary"]
-                                results["lengthInMeters"] = summary["distance"]
-                                results["travelTimeInSeconds"] = summary["duration"]
-                                results["descent"] = pyroute["features"][0]["properties"]["descent"]
-                                results["ascent"] = pyroute["features"][0]["properties"]["ascent"]                        
-                    else:
-                        print(f'unknown router {args.router}')
-    except Exception as err:
-        print(f'Other error occurred in {id}: {err}')
-        raise
-    return results
+                    response = post_data(sendurl, headers, body, self.session, timeout or self.timeout)
+            except requests.exceptions.RequestException as err:
+                if not isretryable(err):
+                    logger.error('\t%s : %s', id, err)
+                    raise
+            finally:
+                self.stats.gauge('in flight', -1)
+                self.stats.observe('request seconds', tm.perf_counter() - started, router=self.router,
+                                   endpoint=endpoint)
+                if backend is not None:
+                    self.backends.release(backend, response)
+            self.limiter.update(response)
+            if not istransient(response):
+                return response
+            self.stats.add('transient failures')
+            if attempt + 1 == self.retry.attempts:
+                logger.error('\t%s : giving up after %s attempts', id, self.retry.attempts)
+            elif not self.retry.spend():
+                logger.error('\t%s : retry budget of %s exhausted', id, self.retry.budget)
+                break
+            else:
+                tm.sleep(self.retry.delay(attempt))
+        return response
 
-def getroutepoints(args,pyroute,id):
+    def route(self, start, end, id, departAt=None):
+        """
+            Request the route from start to end
+            
+            Arguments
+            ---------
+                start   : array with  lat lon
+                end     : array with  lat lon
+                id      : str to identify the route
+                departAt : tomtom departure time, tomorrow 2 am if None
+            Returns
+            -------
+                response: can be None
+        """
+        method, url, body, headers = self.routerequest(start, end, id, departAt)
+        return self.send(method, url, body, headers, id)
+
+    def batchsubmit(self, rows, id='', departs=None):
+        """
+            Submit the routes of rows to the tomtom asynchronous batch routing
+            
+            Arguments
+            ---------
+                rows    : list of (id, start, end)
+                id      : str to identify the request in the messages
+                departs : list of the departure time of each row, tomorrow 2 am if None
+            Returns
+            -------
+                response: 202 with the Location of the results when accepted, can be None
+        """
+        departs = departs or [self.departAt] * len(rows)
+        body = {"batchItems": [{"query": self.batchquery.format(start=f'{start[0]},{start[1]}', end=f'{end[0]},{end[1]}',
+                                                                departAt=departAt)}
+                               for (rowid, start, end), departAt in zip(rows, departs)]}
+        return self.send('POST', f'{self.batchurl}?key={self.key}&redirectMode=manual', body, None, id, 'batch')
+
+    def batchdownload(self, location, id=''):
+        """
+            Wait for a tomtom batch to be processed and download its results
+            
+            Arguments
+            ---------
+                location: Location header of the batchsubmit response
+                id      : str to identify the request in the messages
+            Returns
+            -------
+                response: 200 with the batchItems when done, can be None
+        """
+        url = self.batchpollurl(self.batchurl, location)
+        while True:
+            # the server holds the request up to waitTimeSeconds while the batch is processed, the read
+            # timeout is longer so that the long poll is not taken for a network failure
+            response = self.send('GET', url, id=id, endpoint='batch download',
+                                 timeout=(self.timeout, batch_wait + self.timeout))
+            if response is None or response.status_code != 202:
+                return response
+            url = self.batchpollurl(url, response.headers.get('Location', url))
+            tm.sleep(1)
+
+    def batchpollurl(self, url, location):
+        """
+            url of the next batch download: location resolved against url, with the key and the
+            waitTimeSeconds added to whatever query it has
+        """
+        parts = urlsplit(urljoin(url, location))
+        query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                 if name != 'waitTimeSeconds']
+        if not any(name == 'key' for name, value in query):
+            query.append(('key', self.key))
+        query.append(('waitTimeSeconds', str(batch_wait)))
+        return urlunsplit(parts._replace(query=urlencode(query)))
+
+    def matrix(self, locations, sources, destinations, id=''):
+        """
+            Request the distance and duration matrix from sources to destinations
+            
+            Arguments
+            ---------
+                locations    : list of [lon, lat]
+                sources      : list of indexes in locations
+                destinations : list of indexes in locations
+                id           : str to identify the request in the messages
+            Returns
+            -------
+                response: can be None
+        """
+        body = {"locations": locations, "sources": sources, "destinations": destinations,
+                "metrics": ["distance", "duration"], "units": "m"}
+        return self.send('POST', self.matrixurl, body, self.headers, id, 'matrix')
+
+    def isochrones(self, coords, ranges, rangetype, id=''):
+        """
+            Request the isochrones of several locations
+            
+            Arguments
+            ---------
+                coords  : list of [lat, lon]
+                ranges  : list of range values
+                rangetype : 'time' or 'distance'
+                id      : str to identify the request in the messages
+            Returns
+            -------
+                response: can be None
+        """
+        if self.api == 'v1':
+            url = self.isochroneurl.format(locations='|'.join(f'{lon},{lat}' for lat, lon in coords),
+                                           ranges=','.join(map(str, ranges)))
+            return self.send('GET', url, id=id, endpoint='isochrones')
+        body = {"locations": [[lon, lat] for lat, lon in coords], "range": ranges, "range_type": rangetype,
+                "attributes": ["area"], "area_units": "m", "units": "m"}
+        return self.send('POST', self.isochroneurl, body, self.headers, id, 'isochrones')
+
+    def close(self):
+        if self.backends is not None:
+            self.backends.close()
+        self.session.close()
+
+def routeprofile(args):
     """
-        Process the python structure to retrieve the route coordinates
+        Vehicle profile of the request, in the words of the router
         
         Arguments
         ---------
             args    : from argparse
-            pyroute : python object: corresponding to the json decoding
-            id      : str to identify the route
         Returns
         -------
-            DataFrame:  a succession of coordinates of the route
-                        id,latitude,longitude,seq
+            str: openrouteservice profile or tomtom travelMode
     """
-    df = pd.DataFrame()
-    latitude = []
-    longitude = []
-    sequence = []
-    seq = 0
-    try:
-        if pyroute:
-            if(args.router=='tomtom'):
-                if type(pyroute) is dict: 
-                    if "routes" in pyroute:
-                        for leg in pyroute["routes"][0]["legs"]: # TODO check for error
-                            for point in leg["points"]:
-                                seq += 1
-                                latitude.append(point["latitude"])
-                                longitude.append(point["longitude"])
-                                sequence.append(seq)
-                            df = pd.DataFrame({'id':id, 'latitude': latitude, 'longitude':longitude, 'seq':sequence})
-                            print(f'\t{id}: points count: {len(df.index)}')
-            elif(args.router=='ors'):
-                if type(pyroute) is dict: 
-                    if "features" in pyroute:
-                        altitude = []
-                        for point in pyroute["features"][0]["geometry"]["coordinates"]:
-                            seq += 1
-                            longitude.append(point[0])
-                            latitude.append(point[1])
-                            if len(point)==3:
-                                altitude.append(point[2])
-                            else:
-                                altitude.append(np.nan)
-                            sequence.append(seq)
-                        df = pd.DataFrame({'id':id, 'latitude': latitude, 'longitude':longitude,'altitude':altitude,'seq':sequence})
-                        print(f'\t{id}: points count: {len(df.index)}')
-            else:
-                print(f'unknown router {args.router}')
-    except Exception as err:
-        print(f'Other error occurred: {err}')
-        raise
-    return df
+    if args.router == 'ors':
+        if args.travelMode=='pedestrian':
+            return 'foot-walking'
+        return 'driving-car'
+    return args.travelMode
 
-def getApiKey(args):
+def requestkey(args, start, end, digits=6, departAt=None):
     """
-        Read a text key file in args.key with the key for the API
-
+        Cache key of a route request
+        
         Arguments
         ---------
             args    : from argparse
+            start   : array with  lat lon
+            end     : array with  lat lon
+            digits  : decimals kept from the coordinates
+            departAt : departure time of a --depart-times route, appended to the key
         Returns
         -------
-            string with the key
+            str: router|profile|weighting|travelMode|start_lat,start_lon|end_lat,end_lon[|departAt]
     """
-    data=''
-    try:
-        with open(f'{args.key}', 'r') as file:
-            data = file.read().replace('\n', '')
-    except Exception as err:
-        print(f'Error occurred: {err}')
-    return data
+    key = f'{args.router}|{routeprofile(args)}|{args.route_weighting}|{args.travelMode}' \
+          f'|{float(start[0]):.{digits}f},{float(start[1]):.{digits}f}|{float(end[0]):.{digits}f},{float(end[1]):.{digits}f}'
+    if departAt:
+        key += f'|{departAt}'
+    return key
 
-def saveResults(args,df):
+def planroutes(args, rows):
     """
-        Save df results in csv|gpkg format accordingly with args.csv
-        Write file in args.outfile
+        Group the rows sharing the same request, coordinates rounded to args.round decimals
         
         Arguments
         ---------
             args    : from argparse
-            df      : GeoDataFrame if args.summary, DataFrame otherwise
+            rows    : list of (id, start, end)
+        Returns
+        -------
+            unique  : list of (id, start, end), the first row of each request
+            plan    : list with the index in unique of the request of each row
     """
-    df.to_csv(args.outfile, index=False, header=True)
-    if args.summary & args.geometry:
-        basename=os.path.basename(args.outfile)
-        basename=basename[:-4] # assuming '.csv'
-        dirname =os.path.dirname(args.outfile)
-        df.to_file(f'{dirname}/{basename}.gpkg',layer=basename,driver="GPKG")
+    planned = {}
+    unique = []
+    plan = []
+    for id, start, end in rows:
+        key = requestkey(args, start, end, args.round)
+        if key not in planned:
+            planned[key] = len(unique)
+            unique.append((id, start, end))
+        plan.append(planned[key])
+    return unique, plan
 
-def handler(args):
-    """ 
-        Main handler 
+
+class RunStats:
     """
-    print('route.py starting\n')
-    if args.check:
+        Counters, gauges and latency histograms of a run shared by the threads, printed as the run
+        summary and exported by MetricsReporter
+        
+        A metric is a name and labels such as router and endpoint; the histograms count seconds in
+        the same buckets for every stage.
+    """
+    buckets = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+    def __init__(self):
+        self.counts = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.started = tm.monotonic()
+        self.lock = threading.Lock()
+
+    def add(self, name, count=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + count
+
+    def get(self, name, **labels):
+        return self.counts.get((name, tuple(sorted(labels.items()))), 0)
+
+    def gauge(self, name, delta):
+        with self.lock:
+            self.gauges[name] = self.gauges.get(name, 0) + delta
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+
+    @contextlib.contextmanager
+    def time(self, name, **labels):
+        started = tm.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, tm.perf_counter() - started, **labels)
+
+    def merge(self, histograms):
+        """
+            Add the histograms of a RunStats of another process
+        """
+        for key, (counts, total) in histograms.items():
+            with self.lock:
+                histogram = self.histograms.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+                histogram[0] = [mine + other for mine, other in zip(histogram[0], counts)]
+                histogram[1] += total
+
+    def quantile(self, counts, q):
+        """
+            Upper bound of the bucket holding the q quantile
+        """
+        rank = q * sum(counts)
+        for bound, cumulative in zip(self.buckets + [float('inf')], itertools.accumulate(counts)):
+            if cumulative >= rank:
+                return bound
+        return float('inf')
+
+    @staticmethod
+    def label(name, labels):
+        return name + ('{' + ','.join(f'{key}={value}' for key, value in labels) + '}' if labels else '')
+
+    def summary(self):
+        with self.lock:
+            counts = list(self.counts.items())
+            histograms = [(key, counts_[:], total) for key, (counts_, total) in self.histograms.items()]
+        text = ', '.join(f'{self.label(name, labels)}: {count}' for (name, labels), count in counts)
+        for (name, labels), buckets, total in histograms:
+            text += f', {self.label(name, labels)}: {sum(buckets)} in {total:.2f}s (p50 < {self.quantile(buckets, 0.5)}s,' \
+                    f' p99 < {self.quantile(buckets, 0.99)}s)'
+        return text
+
+    def prometheus(self):
+        """
+            Returns
+            -------
+                str: the metrics in the Prometheus text exposition format
+        """
+        def metric(name):
+            return 'route_' + re.sub('[^a-zA-Z0-9]+', '_', name).strip('_')
+
+        def labels(pairs, extra=()):
+            pairs = list(pairs) + list(extra)
+            return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}' if pairs else ''
+
+        lines = []
+        def declare(name, kind):
+            # a single TYPE line for all the label sets of a metric
+            if f'# TYPE {name} {kind}' not in lines:
+                lines.append(f'# TYPE {name} {kind}')
+
+        with self.lock:
+            for (name, pairs), count in sorted(self.counts.items()):
+                declare(f'{metric(name)}_total', 'counter')
+                lines.append(f'{metric(name)}_total{labels(pairs)} {count}')
+            for name, value in sorted(self.gauges.items()):
+                declare(metric(name), 'gauge')
+                lines.append(f'{metric(name)}{labels(())} {value}')
+            for (name, pairs), (counts, total) in sorted(self.histograms.items()):
+                declare(metric(name), 'histogram')
+                for bound, cumulative in zip(self.buckets + ['+Inf'], itertools.accumulate(counts)):
+                    lines.append(f'{metric(name)}_bucket{labels(pairs, [("le", bound)])} {cumulative}')
+                lines.append(f'{metric(name)}_sum{labels(pairs)} {total}')
+                lines.append(f'{metric(name)}_count{labels(pairs)} {sum(counts)}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """
+            Returns
+            -------
+                dict: the metrics as a JSON line, the histograms as count, sum and quantiles
+        """
+        with self.lock:
+            return {'time': datetime.datetime.now().isoformat(timespec='seconds'),
+                    'elapsed': round(tm.monotonic() - self.started, 3),
+                    'counters': {self.label(name, labels): count for (name, labels), count in self.counts.items()},
+                    'gauges': dict(self.gauges),
+                    'histograms': {self.label(name, labels): {'count': sum(counts), 'sum': round(total, 6),
+                                                              'p50': self.quantile(counts, 0.5),
+                                                              'p99': self.quantile(counts, 0.99)}
+                                   for (name, labels), (counts, total) in self.histograms.items()}}
+
+
+class MetricsReporter:
+    """
+        Log a progress line every args.progress seconds and export the metrics of a RunStats to
+        args.metrics: Prometheus text rewritten at each export, or a JSON line appended at each
+        export when the file ends with .jsonl
+    """
+    def __init__(self, args, stats, total=None):
+        self.stats = stats
+        self.total = total
+        self.interval = args.progress
+        self.metrics = args.metrics
+        self.stopped = threading.Event()
+        self.thread = None
+        if self.interval > 0:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def report(self):
+        done = self.stats.get('rows done')
+        elapsed = tm.monotonic() - self.stats.started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        line = f'progress: {done}'
+        if self.total:
+            line += f'/{self.total} rows ({100.0 * done / self.total:.1f}%)'
+        else:
+            line += ' rows'
+        line += f', {rate:.1f} rows/s, {self.stats.gauges.get("in flight", 0)} requests in flight'
+        if self.total and rate > 0:
+            line += f', eta {datetime.timedelta(seconds=int((self.total - done) / rate))}'
+        logger.info(line)
+        self.export()
+
+    def export(self):
+        if not self.metrics:
+            return
+        if self.metrics.endswith('.jsonl'):
+            with open(self.metrics, 'a') as file:
+                file.write(json.dumps(self.stats.snapshot()) + '\n')
+        else:
+            # written aside then renamed, a scraper never reads half a file
+            with open(f'{self.metrics}.tmp', 'w') as file:
+                file.write(self.stats.prometheus())
+            os.replace(f'{self.metrics}.tmp', self.metrics)
+
+    def close(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.report()
+        else:
+            self.export()
+
+
+class JsonDirCache:
+    """
+        Responses saved as args.jsondir/{id}.json, one file per route
+    """
+    def __init__(self, jsondir):
+        self.jsondir = jsondir
+
+    def name(self, key, id):
+        return f'{self.jsondir}/{id}.json'
+
+    def get(self, key, id):
+        """
+            Returns
+            -------
+                str: the json text, "null" for a route that failed, None if the route is not in the cache
+        """
+        if not os.path.isfile(self.name(key, id)):
+            return None
+        with open(self.name(key, id), 'r') as file:
+            return file.read().replace('\n', '')
+
+    def put(self, key, id, data, start=None, end=None):
+        with open(self.name(key, id), 'w') as file:
+            file.write(data)
+
+    def close(self):
+        pass
+
+
+class SqliteCache:
+    """
+        Responses saved as zlib compressed json in a single sqlite file, looked up by requestkey
+        
+        The connection is shared by the --workers threads behind a lock; the database runs in WAL
+        mode so that each route is committed as soon as it is downloaded.
+    """
+    def __init__(self, cachefile, args):
+        self.cachefile = cachefile
+        self.router = args.router
+        self.profile = routeprofile(args)
+        self.weighting = args.route_weighting
+        self.travelMode = args.travelMode
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(cachefile, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS routes (key TEXT PRIMARY KEY, router TEXT, profile TEXT, '
+                                'weighting TEXT, travelMode TEXT, start_lat REAL, start_lon REAL, end_lat REAL, '
+                                'end_lon REAL, data BLOB)')
+        self.connection.commit()
+
+    def name(self, key, id):
+        return f'{self.cachefile}:{key}'
+
+    def get(self, key, id):
+        """
+            Returns
+            -------
+                str: the json text, "null" for a route that failed, None if the route is not in the cache
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT data FROM routes WHERE key=?', (key,)).fetchone()
+        if row is None:
+            return None
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def row(self, key, data, start, end):
+        return (key, self.router, self.profile, self.weighting, self.travelMode, start[0], start[1], end[0], end[1],
+                zlib.compress(data.encode('utf-8')))
+
+    def put(self, key, id, data, start=None, end=None):
+        self.putmany([self.row(key, data, start, end)])
+
+    def locations(self):
+        """
+            key and coordinates of the routes of this router, profile, weighting and travelMode
+        """
+        with self.lock:
+            return self.connection.execute('SELECT key, start_lat, start_lon, end_lat, end_lon FROM routes WHERE '
+                                           'router=? AND profile=? AND weighting=? AND travelMode=? AND start_lat '
+                                           'IS NOT NULL', (self.router, self.profile, self.weighting,
+                                                           self.travelMode)).fetchall()
+
+    def putmany(self, rows):
+        with self.lock:
+            self.connection.executemany('INSERT OR REPLACE INTO routes VALUES (?,?,?,?,?,?,?,?,?,?)', rows)
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class SnapCache:
+    """
+        Response cache answering a route request with a cached route whose start and end are both
+        within tolerance metres of the requested ones
+        
+        The starts of the cached routes are indexed in a grid of cellsize metres, the lookup scans
+        the cells around the requested start and keeps the nearest route by start plus end distance.
+        The keys and ids of the routes saved in this run are indexed, and with --cache sqlite the
+        routes already in the cachefile. Isochrone keys and exact matches go to the wrapped cache.
+    """
+    def __init__(self, cache, tolerance, cellsize=0):
+        self.cache = cache
+        self.tolerance = tolerance
+        self.cellsize = cellsize if cellsize > 0 else tolerance
+        self.degrees = self.cellsize / 111320.0
+        self.grid = {}
+        self.lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        if isinstance(cache, SqliteCache):
+            for key, start_lat, start_lon, end_lat, end_lon in cache.locations():
+                self.add(key, None, [start_lat, start_lon], [end_lat, end_lon])
+
+    @staticmethod
+    def coords(key):
+        """
+            start, end of a requestkey, None for the other keys
+        """
+        parts = key.split('|')
+        if len(parts) != 6:
+            return None
+        try:
+            return [float(value) for value in parts[4].split(',')], [float(value) for value in parts[5].split(',')]
+        except ValueError:
+            return None
+
+    def cell(self, lat, lon):
+        return int(np.floor(lat / self.degrees)), int(np.floor(lon / self.degrees))
+
+    def add(self, key, id, start, end):
+        prefix = key.rsplit('|', 2)[0]
+        with self.lock:
+            self.grid.setdefault(self.cell(*start), []).append((prefix, start, end, key, id))
+
+    def distance(self, a, b):
+        dy = (a[0] - b[0]) * 111320.0
+        dx = (a[1] - b[1]) * 111320.0 * np.cos(np.radians(a[0]))
+        return np.sqrt(dx * dx + dy * dy)
+
+    def nearest(self, key, start, end):
+        """
+            Cached routes of the same router, profile, weighting and travelMode within tolerance,
+            nearest first
+        """
+        prefix = key.rsplit('|', 2)[0]
+        row, col = self.cell(*start)
+        rows = int(np.ceil(self.tolerance / self.cellsize))
+        cols = int(np.ceil(self.tolerance / (self.cellsize * max(np.cos(np.radians(start[0])), 0.01))))
+        candidates = []
+        with self.lock:
+            for i in range(row - rows, row + rows + 1):
+                for j in range(col - cols, col + cols + 1):
+                    for entry in self.grid.get((i, j), []):
+                        if entry[0] != prefix:
+                            continue
+                        d = self.distance(start, entry[1])
+                        if d > self.tolerance:
+                            continue
+                        e = self.distance(end, entry[2])
+                        if e <= self.tolerance:
+                            candidates.append((d + e, entry[3], entry[4]))
+        candidates.sort(key=lambda candidate: candidate[0])
+        return candidates
+
+    def name(self, key, id):
+        return self.cache.name(key, id)
+
+    def get(self, key, id):
+        """
+            Returns
+            -------
+                str: the json text of the exact or of the nearest route within tolerance, "null" for
+                     a route that failed, None if there is none
+        """
+        coords = self.coords(key)
+        data = self.cache.get(key, id)
+        if coords is None or data is not None:
+            return data
+        with self.lock:
+            self.lookups += 1
+        for d, nearkey, nearid in self.nearest(key, *coords):
+            data = self.cache.get(nearkey, nearid)
+            # a failed request near by does not mean this one fails
+            if data is not None and data != "null":
+                with self.lock:
+                    self.hits += 1
+                logger.debug('\t%s : route of %s reused, %.1f m away', id, self.cache.name(nearkey, nearid), d)
+                return data
+        return None
+
+    def put(self, key, id, data, start=None, end=None):
+        self.cache.put(key, id, data, start, end)
+        if self.coords(key) is not None and start is not None:
+            self.add(key, id, [float(start[0]), float(start[1])], [float(end[0]), float(end[1])])
+
+    def close(self):
+        if self.lookups:
+            logger.info(f'snap cache: {self.hits} of {self.lookups} routes missing from the cache reused within '
+                  f'{self.tolerance} m ({100.0 * self.hits / self.lookups:.1f}% hit rate), {len(self.grid)} grid cells')
+        self.cache.close()
+
+
+def opencache(args):
+    """
+        Open the response cache selected by args.cache
+        
+        Arguments
+        ---------
+            args    : from argparse
+        Returns
+        -------
+            JsonDirCache or SqliteCache, wrapped in a SnapCache with args.snap
+    """
+    if args.cache == 'sqlite':
+        cache = SqliteCache(args.cachefile, args)
+    else:
+        cache = JsonDirCache(args.jsondir)
+    if args.snap > 0:
+        return SnapCache(cache, args.snap, args.snap_cell)
+    return cache
+
+def migratejsondir(args):
+    """
+        Import the args.jsondir/{id}.json files in the sqlite args.cachefile
+        
+        args.infile gives the coordinates of each id, and the router, weighting and travelMode
+        arguments complete the keys, they must be the ones used to download the files.
+        
+        Arguments
+        ---------
+            args    : from argparse
+    """
+    if not args.infile:
+        logger.error('--migrate needs the --infile with the coordinates of the routes in --jsondir')
+        return
+    jsondir = JsonDirCache(args.jsondir)
+    cache = SqliteCache(args.cachefile, args)
+    inreq = pd.read_csv(args.infile, dtype={'id':'str'})
+    rows = []
+    missing = 0
+    for row in inreq.itertuples(index=False):
+        start = [row.start_lat, row.start_lon]
+        end = [row.end_lat, row.end_lon]
+        key = requestkey(args, start, end)
+        data = jsondir.get(key, row.id)
+        if data is None:
+            missing += 1
+            continue
+        rows.append(cache.row(key, data, start, end))
+        if len(rows) >= 10000:
+            cache.putmany(rows)
+            rows = []
+    cache.putmany(rows)
+    cache.close()
+    logger.info(f'imported {len(inreq.index) - missing} routes from {args.jsondir} in {args.cachefile}, {missing} ids without file')
+
+def isochronesfromfile(args, key):
+    """
+        Download the isochrones from REST router accordingly to the lat/lon coords from args.infile
+        
+        args.infile is a csv file and MUST contain a header with the following:
+            id, lat,lon
+        
+        Arguments
+        ---------
+            args    : from argparse
+            key     : api key value
+        Returns
+        -------
+            GeoDataFrame with an isochrone polygon for each id and range value
+    """
+    df = gpd.GeoDataFrame()
+    if args.infile:
+        dfisochrones = [dfisochrone for ids, dfisochrone, fingerprints in iterisochrones(args, key) if not dfisochrone.empty]
+        if dfisochrones:
+            df = pd.concat([df] + dfisochrones, sort=False)
+    return df
+
+def iterisochrones(args, key, skip=None, stats=None):
+    """
+        Download the isochrones of args.infile, args.chunksize rows at a time and
+        args.isochrone_locations rows per request
+        
+        Arguments
+        ---------
+            args    : from argparse
+            key     : api key value
+            skip    : set of ids not to request, the rows saved by a previous run
+            stats   : RunStats of the run, a new one if None
+        Yields
+        ------
+            ids     : list of the ids of the chunk
+            GeoDataFrame with the isochrones of the chunk, can be empty
+            None    : the isochrones have no fingerprints
+    """
+    def groupfinder(group):
+        logger.debug('rows id %s to %s', group[0][0], group[-1][0])
+        return isochronefinder(args, [coords for id, coords in group], args.ranges, [id for id, coords in group], key,
+                               transport, cache)
+
+    transport = Transport(args, key, stats)
+    cache = opencache(args) if args.json else None
+    executor = ThreadPoolExecutor(max_workers=args.workers) if args.workers > 1 else None
+    try:
+        for inreq in pd.read_csv(args.infile, dtype={'id':'str'}, chunksize=args.chunksize):
+            logger.info(f'read {args.infile}: {len(inreq.index)} lines from line {inreq.index[0] + 1}')
+            rows = [(row.id, [row.lat, row.lon]) for row in inreq.itertuples(index=False)]
+            if skip:
+                rows = [row for row in rows if row[0] not in skip]
+                if not rows:
+                    continue
+            transport.stats.add('rows', len(rows))
+            groups = [rows[first:first + args.isochrone_locations]
+                      for first in range(0, len(rows), args.isochrone_locations)]
+            results = executor.map(groupfinder, groups) if executor is not None else map(groupfinder, groups)
+            dfisochrones = [dfisochrone for dfisochrone in results if not dfisochrone.empty]
+            if dfisochrones:
+                yield [row[0] for row in rows], pd.concat(dfisochrones, sort=False), None
+            else:
+                yield [row[0] for row in rows], gpd.GeoDataFrame(), None
+        logger.info(f'run summary: {transport.stats.summary()}')
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        transport.close()
+        if cache is not None:
+            cache.close()
+
+def isochronefinder(args, coords, ranges, id, key, transport=None, cache=None):
+    """
+        Downloads the isochrones results from REST router accordingly to the coords arguments
+            
+        Arguments
+        ---------
+            args    : from argparse
+            coords   : array with  lat lon, or list of them to get the isochrones of several locations at once
+            ranges   : list of range values in seconds for time and metres for distance
+            id      : str to identify the location, or list of them matching coords
+            key     : api key value
+            transport : Transport shared by the requests of a run, a new one is created if None
+            cache   : response cache used with args.json, opened from args.cache if None
+        Returns
+        -------
+            GeoDataFrame: id, value, area and isochrone polygon for each location and range value
+    """
+    if not isinstance(id, list):
+        coords = [coords]
+        id = [id]
+    data = None
+    if args.router=='ors':
+        if transport is None:
+            transport = Transport(args, key)
+        if args.json:
+            #check if the isochrones are in the cache otherwise do request
+            if cache is None:
+                cache = opencache(args)
+            cachekey = f'isochrones|{routeprofile(args)}|{args.range_type}|{",".join(map(str, ranges))}|' + \
+                       ';'.join(f'{float(lat):.6f},{float(lon):.6f}' for lat, lon in coords)
+            # named after the whole request, a --jsondir file named after the first id would be
+            # read back for another group starting with the same id
+            cacheid = 'isochrones_' + hashlib.sha256(cachekey.encode('utf-8')).hexdigest()[:16]
+            with transport.stats.time('cache seconds', op='get'):
+                data = cache.get(cachekey, cacheid)
+            if data is not None:
+                transport.stats.add('cache hits')
+                logger.debug('\tread ors %s', cache.name(cachekey, cacheid))
+            else:
+                transport.stats.add('cache misses')
+                response = transport.isochrones(coords, ranges, args.range_type, id[0])
+                data = getJSONText(response, id[0])
+                if istransient(response):
+                    logger.warning(f'\t{id[0]} : not saved in {cache.name(cachekey, cacheid)}, will be requested again')
+                else:
+                    with transport.stats.time('cache seconds', op='put'):
+                        cache.put(cachekey, cacheid, data, coords[0], coords[-1])
+        else:
+            response = transport.isochrones(coords, ranges, args.range_type, id[0])
+            logger.debug('ors request')
+            data = getJSONText(response, id[0])
+    else:
+        logger.error(f'router.py does not support the router {args.router}')
+    pyisochrone = json.loads(data) if data else None
+    return getisochroneinfo(args, pyisochrone, id)
+
+class RouteResult:
+    """
+        Route between two points returned by RouteClient
+        
+        Attributes
+        ----------
+            id      : str given to the route
+            start   : [lat, lon] requested
+            end     : [lat, lon] requested
+            status  : 'ok', 'failed' when the router answered with an error, 'no response'
+            lengthInMeters      : float, None unless status is 'ok'
+            travelTimeInSeconds : float, None unless status is 'ok'
+            ascent  : float, metres, None unless given by ors
+            descent : float, metres, None unless given by ors
+            latitude  : numpy array of the route points, None unless status is 'ok'
+            longitude : numpy array of the route points, None unless status is 'ok'
+            altitude  : numpy array of the route points, None unless given by ors
+            pyroute : python object of the router answer, as read by getrouteinfo and getroutepoints
+    """
+    def __init__(self, args, id, start, end, pyroute, status):
+        self.id = id
+        self.start = list(start)
+        self.end = list(end)
+        self.pyroute = pyroute
+        coords = getroutecoords(args, pyroute)
+        if status == 'ok' and (coords is None or len(coords[0]) == 0):
+            status = 'failed'
+        self.status = status
+        summary = getroutesummary(args, pyroute) if status == 'ok' else {}
+        self.lengthInMeters = summary.get('lengthInMeters')
+        self.travelTimeInSeconds = summary.get('travelTimeInSeconds')
+        self.ascent = summary.get('ascent')
+        self.descent = summary.get('descent')
+        self.latitude, self.longitude, self.altitude = coords if status == 'ok' else (None, None, None)
+
+    def __repr__(self):
+        return f'RouteResult(id={self.id!r}, status={self.status!r}, lengthInMeters={self.lengthInMeters}, ' \
+               f'travelTimeInSeconds={self.travelTimeInSeconds})'
+
+
+class RouteClient:
+    """
+        Routing client usable from python code, without the command line
+        
+        The client holds its own settings, the http session, rate limiter and retry policy, the
+        response cache and the local graph. route() and route_many() are coroutines: the requests
+        are sent by a pool of concurrency threads sharing the pooled session, so that many of them
+        are in flight while the event loop goes on.
+        
+            async with RouteClient('ors', key, resturl='http://localhost:8080/ors/v2/directions') as client:
+                results = await client.route_many([('a', [49.49, 5.98], [49.60, 6.13]), ...])
+        
+        Arguments
+        ---------
+            router  : tomtom, ors or local
+            key     : api key value
+            weighting : shortest or fastest
+            travelMode : car or pedestrian
+            resturl : REST routing custom url, or a comma separated list of urls
+            concurrency : number of requests in flight, defaults to max(10, workers)
+            args    : route.py arguments, used instead of the settings above by the command line
+            stats   : RunStats of the requests, a new one if None
+            options : any other route.py option by its argparse name, e.g. timeout=10, json=True,
+                      cache='sqlite', rate='10/s', graph='graph.npz'
+    """
+    def __init__(self, router='tomtom', key='', weighting='shortest', travelMode='car', resturl='',
+                 concurrency=0, args=None, stats=None, **options):
+        if args is None:
+            args = Router().parser.parse_args(['--route'])
+            settings = {'router': router, 'route_weighting': weighting, 'travelMode': travelMode,
+                        'resturl': resturl, **options}
+            for name, value in settings.items():
+                if not hasattr(args, name):
+                    raise TypeError(f'RouteClient got an unknown option {name}')
+                setattr(args, name, value)
+        self.args = args
+        self.key = key
+        self.concurrency = concurrency or max(10, args.workers)
+        if (args.pool_size or max(10, args.workers)) < self.concurrency:
+            args = self.args = argparse.Namespace(**{**vars(args), 'pool_size': self.concurrency})
+        self.transport = Transport(args, key, stats)
+        self.cache = opencache(args) if args.json else None
+        self.engine = None
+        if args.router == 'local':
+            self.engine = LocalEngine(args.graph, args.travelMode, args.route_weighting)
+        self.executor = None
+        self.parser = None
+
+    def pool(self):
+        """
+            Returns
+            -------
+                ThreadPoolExecutor of the concurrency threads sending the requests
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        return self.executor
+
+    def map(self, function, rows):
+        """
+            function applied to each row by the concurrency threads, in the calling thread if concurrency
+            is 1; the results keep the order of rows, whatever order the requests complete in
+        """
+        if self.concurrency > 1:
+            return self.pool().map(function, rows)
+        return map(function, rows)
+
+    def fetchdata(self, start, end, id='', departAt=None):
+        """
+            json text of the route from start to end, from the cache or the router, in the calling thread
+            
+            Arguments
+            ---------
+                as fetch
+                departAt : tomtom departure time, tomorrow 2 am if None
+            Returns
+            -------
+                str: as fetchroute
+        """
+        logger.debug('row id %s start_lat %s', id, start[0])
+        return fetchroute(self.args, start, end, id, self.key, self.transport, self.cache, departAt)
+
+    def fetch(self, start, end, id=''):
+        """
+            Route start to end in the calling thread
+            
+            Arguments
+            ---------
+                start   : array with  lat lon
+                end     : array with  lat lon
+                id      : str to identify the route
+            Returns
+            -------
+                RouteResult
+        """
+        if self.engine is not None:
+            pyroute = self.engine.route(start, end)
+            return RouteResult(self.args, id, start, end, pyroute, 'ok' if pyroute else 'failed')
+        data = self.fetchdata(start, end, id)
+        started = tm.perf_counter()
+        pyroute = json.loads(data) if data else None
+        self.transport.stats.observe('decode seconds', tm.perf_counter() - started)
+        return RouteResult(self.args, id, start, end, pyroute,
+                           'no response' if data is None else 'ok' if pyroute else 'failed')
+
+    async def route(self, start, end, id=''):
+        """
+            Route start to end
+            
+            Arguments
+            ---------
+                as fetch
+            Returns
+            -------
+                RouteResult
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.pool(), self.fetch, start, end, id)
+
+    async def route_many(self, rows):
+        """
+            Route the rows concurrently, the rows sharing the same request are routed once
+            
+            Arguments
+            ---------
+                rows    : iterable of (id, start, end)
+            Returns
+            -------
+                list of RouteResult: in the order of rows
+        """
+        rows = list(rows)
+        unique, plan = self.plan(rows)
+        results = await asyncio.gather(*(self.route(start, end, id) for id, start, end in unique))
+        self.sharecache(rows, unique, plan)
+        routes = []
+        for (id, start, end), index in zip(rows, plan):
+            result = results[index]
+            if result.id != id:
+                result = copy.copy(result)
+                result.id = id
+            routes.append(result)
+        return routes
+
+    def plan(self, rows):
+        """
+            Group the rows sharing the same request, as planroutes, and count them
+        """
+        unique, plan = planroutes(self.args, rows)
+        self.transport.stats.add('rows', len(rows))
+        self.transport.stats.add('duplicates', len(rows) - len(unique))
+        return unique, plan
+
+    def sharecache(self, rows, unique, plan):
+        """
+            Copy the --jsondir file of each request to the ids of the rows that shared it, so that
+            the directory keeps a file per id
+            
+            Arguments
+            ---------
+                rows, unique, plan : the rows and the plan of plan()
+        """
+        if not isinstance(self.cache, JsonDirCache):
+            return
+        for (id, start, end), index in zip(rows, plan):
+            source = self.cache.name(None, unique[index][0])
+            if unique[index][0] != id and os.path.isfile(source):
+                shutil.copyfile(source, self.cache.name(None, id))
+
+    def frames(self, rows):
+        """
+            Route the rows and give them as route.py saves them, the rows sharing the same request are
+            routed once
+            
+            The local graph, the ors matrix api or the tomtom batch routing answer the rows when args
+            asks for them, the single routes are requested by the concurrency threads and decoded by
+            the args.parse_procs processes or by the threads themselves.
+            
+            Arguments
+            ---------
+                rows    : list of (id, start, end)
+            Returns
+            -------
+                list of DataFrame: as routefinder for each row, can be empty
+        """
+        def rowfinder(row):
+            id, start, end = row
+            return parseroute(args, self.fetchdata(start, end, id), id, stats)
+
+        def rowfetcher(row):
+            id, start, end = row
+            return self.fetchdata(start, end, id)
+
+        args = self.args
+        stats = self.transport.stats
+        unique, plan = self.plan(rows)
+        if self.engine is not None:
+            with stats.time('local seconds'):
+                results = localfinder(args, unique, self.engine)
+        elif args.matrix:
+            results = matrixfinder(args, unique, self.transport, self.pool() if self.concurrency > 1 else None)
+        elif args.parse_procs > 0 or args.batch:
+            if args.batch:
+                fetched = batchfetcher(args, unique, self.transport, self.cache)
+            else:
+                fetched = self.map(rowfetcher, unique)
+            if args.parse_procs > 0:
+                if self.parser is None:
+                    self.parser = ProcessPoolExecutor(max_workers=args.parse_procs)
+                parseargs = argparse.Namespace(**{name: value for name, value in vars(args).items() if name != 'fonc'})
+                # the responses are handed to the parser processes while the next ones download
+                batches = []
+                batch = []
+                for (id, start, end), data in zip(unique, fetched):
+                    batch.append((id, data))
+                    if len(batch) == parse_batch_size:
+                        batches.append(self.parser.submit(parsebatch, parseargs, batch))
+                        batch = []
+                if batch:
+                    batches.append(self.parser.submit(parsebatch, parseargs, batch))
+                results = []
+                for batch in batches:
+                    dfroutes, histograms = batch.result()
+                    results.extend(dfroutes)
+                    stats.merge(histograms)
+            else:
+                results = [parseroute(args, data, id, stats) for (id, start, end), data in zip(unique, fetched)]
+        else:
+            results = list(self.map(rowfinder, unique))
+        self.sharecache(rows, unique, plan)
+        dfroutes = []
+        for (id, start, end), index in zip(rows, plan):
+            dfroute = results[index]
+            if not dfroute.empty and unique[index][0] != id:
+                dfroute = dfroute.assign(id=id)
+            dfroutes.append(dfroute)
+        return dfroutes
+
+    def frame(self, result):
+        """
+            DataFrame of a RouteResult, as route.py saves it
+            
+            Returns
+            -------
+                DataFrame: as routefinder
+        """
+        if self.args.summary:
+            return getrouteinfo(self.args, result.pyroute, result.id)
+        return getroutepoints(self.args, result.pyroute, result.id)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+        if self.parser is not None:
+            self.parser.shutdown()
+        self.transport.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+
+def routesfromfile(args, key):
+    """
+        Download the routing results from REST router accordingly to the start/end coords from args.infile
+        
+        args.infile is a csv file and MUST contain a header with the following:
+            id, start_lat, start_lon, end_lat, end_lon
+        
+        Arguments
+        ---------
+            args    : from argparse
+            key     : api key value
+        Returns
+        -------
+            DataFrame with route points if args.summary is True, GeoDataFrame with route line and summary otherwise
+    """
+    df = pd.DataFrame()
+    if args.infile:
+        dfroutes = [dfroute for ids, dfroute, fingerprints in iterroutes(args, key) if not dfroute.empty]
+        if dfroutes:
+            # a GeoDataFrame only when the routes have a geometry, geopandas is not loaded otherwise
+            df = pd.concat(dfroutes, sort=False)
+    return df
+
+def iterroutes(args, key, skip=None, stats=None):
+    """
+        Download the routing results of args.infile, args.chunksize rows at a time
+        
+        Rows with the same coordinates (args.round decimals), router, weighting and travelMode are
+        requested once in a chunk and their result is copied for each id.
+        With args.workers > 1 the routes are requested concurrently; the rows keep the args.infile order.
+        
+        Arguments
+        ---------
+            args    : from argparse
+            key     : api key value
+            skip    : as chunkrows
+            stats   : RunStats of the run, a new one if None
+        Yields
+        ------
+            ids     : list of the ids of the chunk, as chunkrows
+            DataFrame with the routes of a chunk, as routesfromfile, can be empty
+            fingerprints : list of the fingerprints of ids
+    """
+    client = RouteClient(args=args, key=key, stats=stats, concurrency=args.workers)
+    try:
+        for inreq in pd.read_csv(args.infile, dtype={'id':'str'}, chunksize=args.chunksize):
+            logger.info(f'read {args.infile}: {len(inreq.index)} lines from line {inreq.index[0] + 1}')
+            rows, ids, fingerprints = chunkrows(args, inreq, skip)
+            if not ids:
+                continue
+            dfroutes = [dfroute for dfroute in client.frames(rows) if not dfroute.empty] if rows else []
+            if dfroutes:
+                yield ids, pd.concat(dfroutes, sort=False), fingerprints
+            else:
+                yield ids, pd.DataFrame(), fingerprints
+        logger.info(f'run summary: {client.transport.stats.summary()}')
+    finally:
+        client.close()
+
+def iterdeparts(args, key, skip=None, stats=None):
+    """
+        Route the rows of args.infile at each of the args.depart_times, args.chunksize routes at a time
+        
+        The rows sharing the same request are routed once per departure time. The routes of the sweep
+        share the Transport connections and the cache, where the departure time is part of the key,
+        and go through the batch routing with args.batch.
+        
+        Arguments
+        ---------
+            as iterroutes
+        Yields
+        ------
+            ids     : list of the ids of the chunk, as chunkrows
+            DataFrame with id, departAt, travelTimeInSeconds and trafficDelayInSeconds, a row per id
+            and departure time of a route found
+            fingerprints : list of the fingerprints of ids
+    """
+    def sweepfetcher(sweeprow):
+        (id, start, end), departAt = sweeprow
+        return client.fetchdata(start, end, id, departAt)
+
+    times = args.depart_times
+    client = RouteClient(args=args, key=key, stats=stats, concurrency=args.workers)
+    transport, cache = client.transport, client.cache
+    try:
+        for inreq in pd.read_csv(args.infile, dtype={'id':'str'}, chunksize=max(1, args.chunksize // len(times))):
+            logger.info(f'read {args.infile}: {len(inreq.index)} lines from line {inreq.index[0] + 1}')
+            rows, ids, fingerprints = chunkrows(args, inreq, skip)
+            if not ids:
+                continue
+            if not rows:
+                yield ids, pd.DataFrame(), fingerprints
+                continue
+            unique, plan = client.plan(rows)
+            # the cache and the messages tell the departure times of a row apart by its id
+            sweep = [((sweepid(id, departAt), start, end), departAt) for id, start, end in unique for departAt in times]
+            if args.batch:
+                fetched = batchfetcher(args, [row for row, departAt in sweep], transport, cache,
+                                       [departAt for row, departAt in sweep])
+            else:
+                fetched = client.map(sweepfetcher, sweep)
+            summaries = []
+            for data in fetched:
+                started = tm.perf_counter()
+                pyroute = json.loads(data) if data else None
+                transport.stats.observe('decode seconds', tm.perf_counter() - started)
+                if pyroute and type(pyroute) is dict and "routes" in pyroute:
+                    summaries.append(pyroute["routes"][0]["summary"])
+                else:
+                    summaries.append(None)
+            for departAt in times:
+                client.sharecache([(sweepid(id, departAt), start, end) for id, start, end in rows],
+                                  [(sweepid(id, departAt), start, end) for id, start, end in unique], plan)
+            columns = {'id': [], 'departAt': [], 'travelTimeInSeconds': [], 'trafficDelayInSeconds': []}
+            for (id, start, end), index in zip(rows, plan):
+                for position, departAt in enumerate(times):
+                    summary = summaries[index * len(times) + position]
+                    if summary is None:
+                        continue
+                    columns['id'].append(id)
+                    columns['departAt'].append(departAt)
+                    columns['travelTimeInSeconds'].append(summary.get('travelTimeInSeconds'))
+                    columns['trafficDelayInSeconds'].append(summary.get('trafficDelayInSeconds', 0))
+            yield ids, pd.DataFrame(columns), fingerprints
+        logger.info(f'run summary: {transport.stats.summary()}')
+    finally:
+        client.close()
+
+def chunkrows(args, inreq, skip=None):
+    """
+        Rows of an args.infile chunk to route, with the fingerprints the run manifest saves for them
+        
+        Arguments
+        ---------
+            args    : from argparse
+            inreq   : DataFrame of the chunk
+            skip    : set of ids not to route, the rows saved by a previous run, or dict id -> fingerprint
+                      of the rows of the last run, routed again by --incremental only if they changed
+        Returns
+        -------
+            rows    : list of (id, start, end) to route
+            ids     : list of the ids of the chunk, but the ids of a skip set
+            fingerprints : list of the rowfingerprint of ids
+    """
+    rows = []
+    ids = []
+    fingerprints = []
+    for row in inreq.itertuples(index=False):
+        if skip and not isinstance(skip, dict) and row.id in skip:
+            continue
+        start, end = [row.start_lat, row.start_lon], [row.end_lat, row.end_lon]
+        fingerprint = rowfingerprint(args, start, end)
+        ids.append(row.id)
+        fingerprints.append(fingerprint)
+        if not isinstance(skip, dict) or skip.get(row.id) != fingerprint:
+            rows.append((row.id, start, end))
+    return rows, ids, fingerprints
+
+def sweepid(id, departAt):
+    """
+        id of the route of row id at departAt, in the cache and the messages
+    """
+    return f"{id}_{re.sub('[^0-9T]', '', departAt)}"
+
+def routefinder(args, start, end, id, key, transport=None, cache=None):
+    """
+        Downloads the routing results from REST router accordingly to the start, end arguments
+            
+        Arguments
+        ---------
+            args    : from argparse
+            start   : array with  lat lon
+            end     : array with  lat lon
+            id      : str to identify the route
+            key     : api key value
+            transport : Transport shared by the routes of a run, a new one is created if None
+            cache   : response cache used with args.json, opened from args.cache if None
+        Returns
+        -------
+            DataFrame: with route points if args.summary is True, GeoDataFrame with route line and summary otherwise
+    """
+    if args.router == 'local':
+        return localfinder(args, [(id, start, end)], LocalEngine(args.graph, args.travelMode, args.route_weighting))[0]
+    return parseroute(args, fetchroute(args, start, end, id, key, transport, cache), id,
+                      transport.stats if transport is not None else None)
+
+def fetchroute(args, start, end, id, key, transport=None, cache=None, departAt=None):
+    """
+        Downloads the json text of the route from the cache or the REST router, without decoding it
+            
+        Arguments
+        ---------
+            as routefinder
+            departAt : tomtom departure time, tomorrow 2 am if None
+        Returns
+        -------
+            str: the json text, "null" for a route that failed, None if there is no response
+    """
+    data = None
+    if args.router in ['tomtom', 'ors']:
+        if transport is None:
+            transport = Transport(args, key)
+        if args.json:
+            #check if the route is in the cache otherwise do request
+            if cache is None:
+                cache = opencache(args)
+            cachekey = requestkey(args, start, end, departAt=departAt)
+            with transport.stats.time('cache seconds', op='get'):
+                data = cache.get(cachekey, id)
+            if data is not None:
+                transport.stats.add('cache hits')
+                if args.router == 'ors':
+                    logger.debug('\tread ors %s', cache.name(cachekey, id))
+            else:
+                transport.stats.add('cache misses')
+                response = transport.route(start, end, id, departAt)
+                if args.router == 'ors' and response is not None:
+                    logger.debug('%s %s', response.status_code, response.reason)
+                    logger.debug('\tors request |save json')
+                data = getJSONText(response, id)
+                # save json for later, unless the failure may go away on the next run
+                if istransient(response):
+                    logger.warning(f'\t{id} : not saved in {cache.name(cachekey, id)}, will be requested again')
+                else:
+                    with transport.stats.time('cache seconds', op='put'):
+                        cache.put(cachekey, id, data, start, end)
+        else:
+            if test:
+                testfile = 'U:\\temp\\route.json'
+                if args.router == 'ors':
+                    testfile = 'U:/Projets/2018_CURHA_GPS/data/walk/ors/example.geojson'
+                with open(testfile, 'r') as file:
+                    data = file.read().replace('\n', '')
+            else:
+                response = transport.route(start, end, id, departAt)
+                if args.router == 'ors':
+                    logger.debug('ors request')
+                data = getJSONText(response, id)
+    else:
+        logger.error(f'router.py does not support the router {args.router}')
+    return data
+
+def parseroute(args, data, id, stats=None):
+    """
+        Decode the json text of a route and retrieve its summary or points
+        
+        Arguments
+        ---------
+            args    : from argparse
+            data    : json text from fetchroute, can be None
+            id      : str to identify the route
+            stats   : RunStats timing the json decoding and the DataFrame building, can be None
+        Returns
+        -------
+            DataFrame: as routefinder
+    """
+    started = tm.perf_counter()
+    pyroute = json.loads(data) if data else None
+    decoded = tm.perf_counter()
+    if args.summary:
+        #print(f'route info output  implemented  for {args.router}')
+        df = getrouteinfo(args, pyroute,id)
+    else:
+        #print(f'route points output  implemented  for {args.router}')
+        df = getroutepoints(args, pyroute,id)
+    if stats is not None:
+        stats.observe('decode seconds', decoded - started)
+        stats.observe('frame seconds', tm.perf_counter() - decoded)
+    return df
+
+def plantiles(rows, limit):
+    """
+        Pack route requests in matrix tiles of at most limit sources x destinations
+        
+        The rows are grouped by start, so that an origin with many destinations fills a tile
+        by itself and origins sharing a few destinations are packed together.
+        
+        Arguments
+        ---------
+            rows    : list of (id, start, end)
+            limit   : maximum number of sources x destinations of a tile
+        Returns
+        -------
+            list of tiles: (sources, destinations, items), sources and destinations are lists of
+                           (lat, lon), items is a list of (row index, source index, destination index)
+    """
+    origins = {}
+    for index, (id, start, end) in enumerate(rows):
+        origins.setdefault(tuple(start), []).append((index, tuple(end)))
+    tiles = []
+    sources = []
+    destinations = {}
+    items = []
+    def flush():
+        if items:
+            tiles.append((sources[:], list(destinations), items[:]))
+        sources.clear()
+        destinations.clear()
+        items.clear()
+    for origin, targets in origins.items():
+        # an origin with more destinations than the limit is split over several tiles
+        for first in range(0, len(targets), limit):
+            part = targets[first:first + limit]
+            newdestinations = set(destinations) | {end for index, end in part}
+            if (len(sources) + 1) * len(newdestinations) > limit:
+                flush()
+            sources.append(origin)
+            for index, end in part:
+                if end not in destinations:
+                    destinations[end] = len(destinations)
+                items.append((index, len(sources) - 1, destinations[end]))
+    flush()
+    return tiles
+
+def matrixfinder(args, rows, transport, executor=None):
+    """
+        Length and travel time of the rows from the openrouteservice matrix API
+        
+        Arguments
+        ---------
+            args    : from argparse
+            rows    : list of (id, start, end)
+            transport : Transport of the run
+            executor : ThreadPoolExecutor to request the tiles concurrently, can be None
+        Returns
+        -------
+            list of DataFrame: id, lengthInMeters, travelTimeInSeconds for each row, empty if no route was found
+    """
+    def tilefinder(tile):
+        sources, destinations, items = tile
+        locations = [[lon, lat] for lat, lon in sources + destinations]
+        logger.debug('matrix %s x %s for %s rows', len(sources), len(destinations), len(items))
+        response = transport.matrix(locations, list(range(len(sources))),
+                                    list(range(len(sources), len(locations))), rows[items[0][0]][0])
+        pymatrix = getJSONResponse(response, rows[items[0][0]][0])
+        return items, pymatrix
+
+    results = [pd.DataFrame()] * len(rows)
+    tiles = plantiles(rows, args.matrix_limit)
+    transport.stats.add('matrix requests', len(tiles))
+    for items, pymatrix in (executor.map(tilefinder, tiles) if executor is not None else map(tilefinder, tiles)):
+        if not pymatrix or "distances" not in pymatrix:
+            continue
+        for index, source, destination in items:
+            distance = pymatrix["distances"][source][destination]
+            duration = pymatrix["durations"][source][destination]
+            if distance is None or duration is None: # unreachable
+                continue
+            results[index] = pd.DataFrame({'id': rows[index][0], 'lengthInMeters': distance,
+                                           'travelTimeInSeconds': duration}, index=[0])
+    return results
+
+def batchfetcher(args, rows, transport, cache=None, departs=None):
+    """
+        Downloads the json texts of the rows with the tomtom asynchronous batch routing
+        
+        The rows missing from the cache are split in batches of args.batch_size, all of them are
+        submitted before waiting for the first one, then each batch item is saved as the response
+        of its row.
+        
+        Arguments
+        ---------
+            args    : from argparse
+            rows    : list of (id, start, end)
+            transport : Transport of the run
+            cache   : response cache used with args.json, can be None
+            departs : list of the departure time of each row, tomorrow 2 am if None
+        Returns
+        -------
+            list of str: the json text of each row, as fetchroute
+    """
+    data = [None] * len(rows)
+    departs = departs or [None] * len(rows)
+    todo = []
+    for index, (id, start, end) in enumerate(rows):
+        if cache is not None:
+            with transport.stats.time('cache seconds', op='get'):
+                data[index] = cache.get(requestkey(args, start, end, departAt=departs[index]), id)
+            if data[index] is not None:
+                transport.stats.add('cache hits')
+                continue
+            transport.stats.add('cache misses')
+        todo.append(index)
+    pending = []
+    for first in range(0, len(todo), args.batch_size):
+        indexes = todo[first:first + args.batch_size]
+        batchid = f'batch of {rows[indexes[0]][0]}'
+        response = transport.batchsubmit([rows[index] for index in indexes], batchid,
+                                         [departs[index] or transport.departAt for index in indexes])
+        if response is None or response.status_code != 202 or 'Location' not in response.headers:
+            logger.warning(f'\t{batchid} : batch not accepted')
+            continue
+        logger.info(f'\t{batchid} : {len(indexes)} routes submitted')
+        transport.stats.add('batches')
+        pending.append((indexes, response.headers['Location'], batchid))
+    for indexes, location, batchid in pending:
+        pybatch = getJSONResponse(transport.batchdownload(location, batchid), batchid)
+        if not pybatch or "batchItems" not in pybatch:
+            continue
+        for index, item in zip(indexes, pybatch["batchItems"]):
+            id, start, end = rows[index]
+            status = item.get("statusCode")
+            if status == requests.codes.ok:
+                data[index] = json.dumps(item["response"])
+            elif status in transient_status:
+                logger.warning(f'\t{id} : batch item code is {status}')
+                continue # not saved, requested again by the next run
+            else:
+                logger.warning(f'\t{id} : batch item code is {status}')
+                data[index] = "null"
+            if cache is not None:
+                with transport.stats.time('cache seconds', op='put'):
+                    cache.put(requestkey(args, start, end, departAt=departs[index]), id, data[index], start, end)
+    return data
+
+def localfinder(args, rows, engine):
+    """
+        Route the rows on the local graph, the rows sharing a start are answered by a single
+        one to many search
+        
+        Arguments
+        ---------
+            args    : from argparse
+            rows    : list of (id, start, end)
+            engine  : LocalEngine of the run
+        Returns
+        -------
+            list of DataFrame: as routefinder for each row
+    """
+    origins = {}
+    for index, (id, start, end) in enumerate(rows):
+        origins.setdefault(tuple(start), []).append(index)
+    pyroutes = [None] * len(rows)
+    for start, indexes in origins.items():
+        if len(indexes) == 1:
+            pyroutes[indexes[0]] = engine.route(start, rows[indexes[0]][2])
+        else:
+            for index, pyroute in zip(indexes, engine.routes(start, [rows[index][2] for index in indexes])):
+                pyroutes[index] = pyroute
+    results = []
+    for (id, start, end), pyroute in zip(rows, pyroutes):
+        if args.summary:
+            results.append(getrouteinfo(args, pyroute, id))
+        else:
+            results.append(getroutepoints(args, pyroute, id))
+    return results
+
+
+class LocalEngine:
+    """
+        Shortest or fastest routes on a road graph saved by --buildgraph, answered in process
+        
+        The graph is held as CSR arrays (indptr, indices and the length and time of each edge) for
+        car and foot. A single route is searched with a bidirectional Dijkstra, a start with many
+        ends with a one to many Dijkstra stopping once every end is settled. Coordinates are
+        snapped to the nearest node of the graph through a grid of cellsize degrees.
+    """
+    def __init__(self, graphfile, travelMode='car', weighting='shortest', cellsize=0.01):
+        graph = np.load(graphfile)
+        mode = 'foot' if travelMode == 'pedestrian' else 'car'
+        self.latitude = graph['latitude']
+        self.longitude = graph['longitude']
+        indptr = graph[f'{mode}_indptr']
+        indices = graph[f'{mode}_indices']
+        self.length = graph[f'{mode}_length']
+        self.time = graph[f'{mode}_time']
+        weight = self.length if weighting == 'shortest' else self.time
+        # reverse graph for the backward search, redge gives the forward edge of a reverse edge
+        source = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        order = np.argsort(indices, kind='stable')
+        rindptr = np.concatenate([[0], np.cumsum(np.bincount(indices, minlength=len(indptr) - 1))])
+        # python lists are much faster than numpy arrays to index one item at a time
+        self.indptr = indptr.tolist()
+        self.indices = indices.tolist()
+        self.weight = weight.tolist()
+        self.source = source.tolist()
+        self.rindptr = rindptr.tolist()
+        self.rindices = source[order].tolist()
+        self.redge = order.tolist()
+        # grid of the nodes reached by the graph
+        nodes = np.flatnonzero((np.diff(indptr) > 0) | (np.diff(rindptr) > 0))
+        self.cellsize = cellsize
+        cells = np.floor(self.latitude[nodes] / cellsize).astype(np.int64) * 1000003 + \
+                np.floor(self.longitude[nodes] / cellsize).astype(np.int64)
+        order = np.argsort(cells, kind='stable')
+        keys, first = np.unique(cells[order], return_index=True)
+        self.grid = dict(zip(keys.tolist(), np.split(nodes[order], first[1:])))
+
+    def snap(self, lat, lon):
+        """
+            Nearest node of the graph to lat, lon
+        """
+        row = int(np.floor(lat / self.cellsize))
+        col = int(np.floor(lon / self.cellsize))
+        for radius in range(0, 50):
+            candidates = [self.grid[(row + i) * 1000003 + col + j]
+                          for i in range(-radius, radius + 1) for j in range(-radius, radius + 1)
+                          if max(abs(i), abs(j)) == radius and (row + i) * 1000003 + col + j in self.grid]
+            if candidates:
+                # a node of the next ring can still be nearer than one in a corner of this ring
+                candidates += [self.grid[(row + i) * 1000003 + col + j]
+                               for i in range(-radius - 1, radius + 2) for j in range(-radius - 1, radius + 2)
+                               if max(abs(i), abs(j)) == radius + 1 and (row + i) * 1000003 + col + j in self.grid]
+                nodes = np.concatenate(candidates)
+                dy = self.latitude[nodes] - lat
+                dx = (self.longitude[nodes] - lon) * np.cos(np.radians(lat))
+                return int(nodes[np.argmin(dx * dx + dy * dy)])
+        return None
+
+    def pyroute(self, edges, node):
+        """
+            Route structure read by getrouteinfo and getroutepoints
+            
+            Arguments
+            ---------
+                edges   : list of the edges of the path, in order
+                node    : the start node, for a path without edges
+        """
+        nodes = [self.source[edge] for edge in edges] + [self.indices[edges[-1]] if edges else node]
+        return {"coordinates": np.column_stack([self.longitude[nodes], self.latitude[nodes]]).tolist(),
+                "lengthInMeters": round(float(self.length[edges].sum()), 1) if edges else 0.0,
+                "travelTimeInSeconds": round(float(self.time[edges].sum()), 1) if edges else 0.0}
+
+    def path(self, pred, node):
+        edges = []
+        while pred[node] >= 0:
+            edges.append(pred[node])
+            node = self.source[pred[node]]
+        edges.reverse()
+        return edges
+
+    def route(self, start, end):
+        """
+            Bidirectional Dijkstra from start to end
+            
+            Arguments
+            ---------
+                start   : array with  lat lon
+                end     : array with  lat lon
+            Returns
+            -------
+                dict: the route, None if end can not be reached from start
+        """
+        source = self.snap(*start)
+        target = self.snap(*end)
+        if source is None or target is None:
+            return None
+        if source == target:
+            return self.pyroute([], source)
+        inf = float('inf')
+        dist = [{source: 0.0}, {target: 0.0}]
+        pred = [{source: -1}, {target: -1}]
+        heaps = [[(0.0, source)], [(0.0, target)]]
+        settled = [set(), set()]
+        best = inf
+        meet = None
+        graphs = [(self.indptr, self.indices, None), (self.rindptr, self.rindices, self.redge)]
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            d, node = heapq.heappop(heaps[side])
+            if node in settled[side]:
+                continue
+            settled[side].add(node)
+            indptr, indices, edgeids = graphs[side]
+            here, there = dist[side], dist[1 - side]
+            for position in range(indptr[node], indptr[node + 1]):
+                edge = edgeids[position] if edgeids is not None else position
+                other = indices[position]
+                newd = d + self.weight[edge]
+                if newd < here.get(other, inf):
+                    here[other] = newd
+                    pred[side][other] = edge
+                    heapq.heappush(heaps[side], (newd, other))
+                    if other in there and newd + there[other] < best:
+                        best = newd + there[other]
+                        meet = other
+        if meet is None:
+            return None
+        edges = self.path(pred[0], meet)
+        node = meet
+        while pred[1][node] >= 0:
+            edges.append(pred[1][node])
+            node = self.indices[pred[1][node]]
+        return self.pyroute(edges, source)
+
+    def routes(self, start, ends):
+        """
+            One to many Dijkstra from start, stopped once all the ends are settled
+            
+            Arguments
+            ---------
+                start   : array with  lat lon
+                ends    : list of array with  lat lon
+            Returns
+            -------
+                list of dict: the route to each end, None if it can not be reached
+        """
+        source = self.snap(*start)
+        targets = [self.snap(*end) for end in ends]
+        if source is None:
+            return [None] * len(ends)
+        remaining = set(target for target in targets if target is not None)
+        inf = float('inf')
+        dist = {source: 0.0}
+        pred = {source: -1}
+        heap = [(0.0, source)]
+        settled = set()
+        while heap and remaining:
+            d, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            remaining.discard(node)
+            for edge in range(self.indptr[node], self.indptr[node + 1]):
+                other = self.indices[edge]
+                newd = d + self.weight[edge]
+                if newd < dist.get(other, inf):
+                    dist[other] = newd
+                    pred[other] = edge
+                    heapq.heappush(heap, (newd, other))
+        return [self.pyroute(self.path(pred, target), source) if target in settled else None for target in targets]
+
+
+# km/h on the highways open to cars, the others are only walked
+car_speed = {'motorway': 110, 'motorway_link': 60, 'trunk': 90, 'trunk_link': 50, 'primary': 70, 'primary_link': 50,
+             'secondary': 60, 'secondary_link': 50, 'tertiary': 50, 'tertiary_link': 40, 'unclassified': 40,
+             'residential': 30, 'living_street': 10, 'service': 20, 'road': 30}
+foot_speed = 5.0
+no_foot = ['motorway', 'motorway_link', 'trunk', 'trunk_link']
+
+def readosm(osmfile):
+    """
+        Read the highways of an OpenStreetMap extract, .osm xml with the standard library or
+        .pbf with pyosmium when it is installed
+        
+        Arguments
+        ---------
+            osmfile : .osm or .osm.pbf file
+        Returns
+        -------
+            ways    : list of (node ids, tags) of the highways
+            coords  : dict node id -> (lat, lon) of their nodes
+    """
+    ways = []
+    coords = {}
+    if osmfile.endswith('.pbf'):
+        try:
+            import osmium
+        except ImportError:
+            logger.error('reading a .pbf file needs pyosmium (pip install osmium), or convert it to .osm')
+            return ways, coords
+
+        class HighwayHandler(osmium.SimpleHandler):
+            def way(self, way):
+                if 'highway' in way.tags:
+                    refs = []
+                    for node in way.nodes:
+                        if node.location.valid():
+                            coords[node.ref] = (node.location.lat, node.location.lon)
+                            refs.append(node.ref)
+                    ways.append((refs, {tag.k: tag.v for tag in way.tags}))
+
+        HighwayHandler().apply_file(osmfile, locations=True)
+        return ways, coords
+    # the nodes come first in the file, a first pass keeps the highways and a second one their nodes
+    for event, element in ET.iterparse(osmfile):
+        if element.tag == 'way':
+            tags = {tag.get('k'): tag.get('v') for tag in element.iter('tag')}
+            if 'highway' in tags:
+                ways.append(([int(nd.get('ref')) for nd in element.iter('nd')], tags))
+        if element.tag in ['node', 'way', 'relation']:
+            element.clear()
+    needed = set(ref for refs, tags in ways for ref in refs)
+    for event, element in ET.iterparse(osmfile):
+        if element.tag == 'node':
+            ref = int(element.get('id'))
+            if ref in needed:
+                coords[ref] = (float(element.get('lat')), float(element.get('lon')))
+        if element.tag in ['node', 'way', 'relation']:
+            element.clear()
+    return ways, coords
+
+def csrgraph(count, source, target, length, time):
+    """
+        Compressed sparse rows of the edges source -> target
+        
+        Returns
+        -------
+            dict: indptr, indices, length and time arrays, edges sorted by source
+    """
+    order = np.argsort(source, kind='stable')
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(source, minlength=count))])
+    return {'indptr': indptr.astype(np.int64), 'indices': target[order].astype(np.int32),
+            'length': length[order].astype(np.float32), 'time': time[order].astype(np.float32)}
+
+def buildgraph(args):
+    """
+        Build the car and foot graphs of args.osmfile and save them in args.graph for --router local
+        
+        Arguments
+        ---------
+            args    : from argparse
+    """
+    ways, coords = readosm(args.osmfile)
+    if not ways:
+        logger.error(f'no highway found in {args.osmfile}')
+        return
+    index = {ref: position for position, ref in enumerate(coords)}
+    latitude = np.array([coords[ref][0] for ref in coords])
+    longitude = np.array([coords[ref][1] for ref in coords])
+    edges = {'car': ([], [], []), 'foot': ([], [], [])}
+    for refs, tags in ways:
+        nodes = [index[ref] for ref in refs if ref in index]
+        if len(nodes) < 2:
+            continue
+        highway = tags['highway']
+        forward = np.array(nodes[:-1])
+        backward = np.array(nodes[1:])
+        if highway in car_speed and tags.get('access') not in ['no', 'private'] and tags.get('motor_vehicle') != 'no':
+            speed = car_speed[highway]
+            if tags.get('maxspeed', '').isdigit():
+                speed = float(tags['maxspeed'])
+            oneway = tags.get('oneway', 'no')
+            if oneway in ['yes', 'true', '1'] or tags.get('junction') == 'roundabout' or highway == 'motorway':
+                pairs = [(forward, backward)]
+            elif oneway == '-1':
+                pairs = [(backward, forward)]
+            else:
+                pairs = [(forward, backward), (backward, forward)]
+            for source, target in pairs:
+                edges['car'][0].append(source)
+                edges['car'][1].append(target)
+                edges['car'][2].append(np.full(len(source), speed))
+        if highway not in no_foot and tags.get('foot') != 'no' and tags.get('access') not in ['no', 'private']:
+            for source, target in [(forward, backward), (backward, forward)]:
+                edges['foot'][0].append(source)
+                edges['foot'][1].append(target)
+                edges['foot'][2].append(np.full(len(source), foot_speed))
+    graph = {'latitude': latitude, 'longitude': longitude}
+    for mode, (sources, targets, speeds) in edges.items():
+        source = np.concatenate(sources) if sources else np.empty(0, dtype=int)
+        target = np.concatenate(targets) if targets else np.empty(0, dtype=int)
+        speed = np.concatenate(speeds) if speeds else np.empty(0)
+        # haversine length of each edge
+        lat1, lon1, lat2, lon2 = map(np.radians, [latitude[source], longitude[source], latitude[target], longitude[target]])
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        length = 2 * 6371008.8 * np.arcsin(np.sqrt(a))
+        for name, values in csrgraph(len(latitude), source, target, length, length / (speed / 3.6)).items():
+            graph[f'{mode}_{name}'] = values
+        logger.info(f'{mode} graph: {len(latitude)} nodes, {len(source)} edges')
+    np.savez_compressed(args.graph, **graph)
+    logger.info(f'graph saved in {args.graph}')
+
+def parsebatch(args, batch):
+    """
+        parseroute a list of (id, data), run by the --parse-procs processes
+        
+        Returns
+        -------
+            list of DataFrame, and the parse time histograms to merge in the RunStats of the run
+    """
+    stats = RunStats()
+    return [parseroute(args, data, id, stats) for id, data in batch], stats.histograms
+
+def writeJSONResponse(args,pyroute,id):
+    """
+        write the JSON structure in args.jsondir/id.json 
+        
+        Arguments
+        ---------
+            args    : from argparse
+            pyroute : python representation of the json structure
+            id      : integer to identify the route
+    """
+    file = open(f'{args.jsondir}/{id}.json', 'w')
+    file.write(json.dumps(pyroute))
+    file.close()
+    
+def getJSONResponse(response,id):
+    """
+        Get the JSON response 
+        
+        Arguments
+        ---------
+            response: the response, can be None
+            id      : str to identify the route
+        Returns
+        -------
+            python object: corresponding to the json decoding
+    """
+    data = getJSONText(response, id)
+    return json.loads(data) if data else None
+
+def getJSONText(response,id):
+    """
+        Get the JSON text of the response, without decoding it
+        
+        Arguments
+        ---------
+            response: the response, can be None
+            id      : str to identify the route
+        Returns
+        -------
+            str: the json text, "null" if the request failed, None if there is no response
+    """
+    if response is None:
+        logger.warning(f'\t{id} : no response')
+        return None
+    if response.status_code == 200:
+        return response.text
+    logger.warning(f'\t{id} : response code is {response.status_code}')
+    return "null"
+
+
+def getisochroneinfo(args,pyisochrone,id):
+    """
+        Process the python structure to retrieve the isochrones with their range value and area
+        
+        Arguments
+        ---------
+            args    : from argparse
+            pyisochrone : python object: corresponding to the json decoding
+            id      : list of str to identify the locations, in the order of the request
+        Returns
+        -------
+            GeoDataFrame: id, value, area, geometry
+    """
+    results = gpd.GeoDataFrame()
+    try:
+        if pyisochrone and type(pyisochrone) is dict and "features" in pyisochrone:
+            features = pyisochrone["features"]
+            if features:
+                properties = pd.DataFrame([feature["properties"] for feature in features])
+                if "group_index" not in properties:
+                    properties["group_index"] = 0
+                d = {'id': np.asarray(id, dtype=object)[properties["group_index"].to_numpy(dtype=int)],
+                     'value': properties["value"].to_numpy()}
+                if "area" in properties:
+                    d['area'] = properties["area"].to_numpy()
+                results = gpd.GeoDataFrame(d, geometry=getisochronegeometry(args,pyisochrone,id), crs='EPSG:4326')
+    except Exception as err:
+        logger.error(f'Other error occurred in {id}: {err}')
+        raise
+    return results
+
+
+def getisochronegeometry(args,pyisochrone,id):
+    """
+        Process the python structure to retrieve the isochrone polygons
+        
+        The outer rings of all the features are built at once with shapely; a feature with holes
+        or another geometry type is converted on its own.
+        
+        Arguments
+        ---------
+            args    : from argparse
+            pyisochrone : python object: corresponding to the json decoding
+            id      : list of str to identify the locations
+        Returns
+        -------
+            array of shapely geometries, one per feature
+    """
+    features = pyisochrone["features"]
+    geometries = np.empty(len(features), dtype=object)
+    simple = [index for index, feature in enumerate(features)
+              if feature["geometry"]["type"] == "Polygon" and len(feature["geometry"]["coordinates"]) == 1]
+    if simple:
+        rings = [np.asarray(features[index]["geometry"]["coordinates"][0], dtype=float)[:, :2] for index in simple]
+        indices = np.repeat(np.arange(len(rings)), [len(ring) for ring in rings])
+        geometries[simple] = shapely.polygons(shapely.linearrings(np.concatenate(rings), indices=indices))
+    for index, feature in enumerate(features):
+        if geometries[index] is None:
+            geometries[index] = shapely.geometry.shape(feature["geometry"])
+    logger.debug('\t%s: isochrones count: %s', id[0], len(features))
+    return geometries
+
+def getrouteinfo(args,pyroute,id):
+    """
+        Process the python structure to retrieve the route summary info such as duration, distance etc.
+        
+        Arguments
+        ---------
+            args    : from argparse
+            pyroute  : python object: corresponding to the json decoding
+            id      : integer to identify the route
+        Returns
+        -------
+            DataFrame: summary, GeoDataFrame with a line geometry if args.geometry
+    """
+    results = pd.DataFrame()
+    try:
+        coords = getroutecoords(args,pyroute)
+        if coords is not None and len(coords[0]) > 0:
+            latitude, longitude, altitude = coords
+            d = {'id':id}
+            results = pd.DataFrame(d, index=[0])
+            if args.geometry:
+                geometry = [None]
+                if len(latitude) > 1:
+                    geometry = [shapely.linestrings(longitude, latitude)]
+                results = gpd.GeoDataFrame({'id':[id]}, geometry=geometry)
+                results.crs = {'init':'epsg:4326'}
+            for name, value in getroutesummary(args, pyroute).items():
+                results[name] = value
+            if args.encode:
+                results[args.encode] = encodegeometry(args, latitude, longitude, altitude)
+    except Exception as err:
+        logger.error(f'Other error occurred in {id}: {err}')
+        raise
+    return results
+
+def getroutesummary(args,pyroute):
+    """
+        Process the python structure to retrieve the route summary fields, in plain python
+        so that quickroute can write them without pandas
+        
+        Arguments
+        ---------
+            args    : from argparse
+            pyroute : python object: corresponding to the json decoding
+        Returns
+        -------
+            dict: lengthInMeters, travelTimeInSeconds and for ors descent and ascent when known
+    """
+    summary = {}
+    if not pyroute or type(pyroute) is not dict:
+        return summary
+    if args.router=='tomtom':
+        if "routes" in pyroute:
+            route = pyroute["routes"][0]["summary"]
+            summary["lengthInMeters"] = route["lengthInMeters"]
+            summary["travelTimeInSeconds"] = route["travelTimeInSeconds"]
+    elif args.router == 'local':
+        summary["lengthInMeters"] = pyroute["lengthInMeters"]
+        summary["travelTimeInSeconds"] = pyroute["travelTimeInSeconds"]
+    elif args.router == 'ors':
+        if "features" in pyroute:
+            properties = pyroute["features"][0]["properties"]
+            if orsapi(args) != 'public':
+                route = properties["summary"] if orsapi(args) == 'v2' else properties["summary"][0]
+                summary["lengthInMeters"] = route.get("distance", 0.0)
+                summary["travelTimeInSeconds"] = route.get("duration", 0.0)
+                if "descent" in route:
+                    summary["descent"] = route["descent"]
+                if "ascent" in route:
+                    summary["ascent"] = route["ascent"]
+            else:
+                summary["lengthInMeters"] = properties["summary"]["distance"]
+                summary["travelTimeInSeconds"] = properties["summary"]["duration"]
+                summary["descent"] = properties["descent"]
+                summary["ascent"] = properties["ascent"]
+    else:
+        logger.error(f'unknown router {args.router}')
+    return summary
+
+def countpoints(args,pyroute):
+    """
+        Count the route points in plain python, as getroutecoords without numpy
+        
+        Arguments
+        ---------
+            args    : from argparse
+            pyroute : python object: corresponding to the json decoding
+        Returns
+        -------
+            int: number of points, 0 if pyroute has no route
+    """
+    if not pyroute or type(pyroute) is not dict:
+        return 0
+    if args.router=='tomtom' and "routes" in pyroute:
+        return sum(len(leg["points"]) for leg in pyroute["routes"][0]["legs"])
+    if args.router=='ors' and "features" in pyroute:
+        return len(pyroute["features"][0]["geometry"]["coordinates"])
+    return 0
+
+def getroutecoords(args,pyroute):
+    """
+        Process the python structure to retrieve the route coordinates as numpy arrays,
+        without a python loop over the points
+        
+        Arguments
+        ---------
+            args    : from argparse
+            pyroute : python object: corresponding to the json decoding
+        Returns
+        -------
+            tuple: latitude, longitude, altitude arrays, altitude is None for tomtom,
+                   None if pyroute has no route
+    """
+    if not pyroute or type(pyroute) is not dict:
+        return None
+    if args.router=='tomtom':
+        if "routes" in pyroute:
+            legs = pyroute["routes"][0]["legs"] # TODO check for error
+            if not legs:
+                return None
+            # itemgetter runs the lookups in C, a leg at a time
+            latitude = np.concatenate([np.fromiter(map(operator.itemgetter('latitude'), leg["points"]), dtype=float,
+                                                   count=len(leg["points"])) for leg in legs])
+            longitude = np.concatenate([np.fromiter(map(operator.itemgetter('longitude'), leg["points"]), dtype=float,
+                                                    count=len(leg["points"])) for leg in legs])
+            return latitude, longitude, None
+    elif args.router=='ors':
+        if "features" in pyroute:
+            coordinates = pyroute["features"][0]["geometry"]["coordinates"]
+            try:
+                points = np.array(coordinates, dtype=float)
+            except ValueError:
+                # some points have an altitude and others not
+                points = np.array([point[:3] + [np.nan] * (3 - len(point)) for point in coordinates], dtype=float)
+            if points.size == 0:
+                return np.empty(0), np.empty(0), np.empty(0)
+            altitude = points[:, 2] if points.shape[1] > 2 else np.full(len(points), np.nan)
+            return points[:, 1], points[:, 0], altitude
+    elif args.router=='local':
+        if "coordinates" in pyroute:
+            points = np.array(pyroute["coordinates"], dtype=float).reshape(-1, 2)
+            return points[:, 1], points[:, 0], None
+    else:
+        logger.error(f'unknown router {args.router}')
+    return None
+
+def getroutepoints(args,pyroute,id):
+    """
+        Process the python structure to retrieve the route coordinates
+        
+        Arguments
+        ---------
+            args    : from argparse
+            pyroute : python object: corresponding to the json decoding
+            id      : str to identify the route
+        Returns
+        -------
+            DataFrame:  a succession of coordinates of the route
+                        id,latitude,longitude,seq
+    """
+    df = pd.DataFrame()
+    try:
+        coords = getroutecoords(args,pyroute)
+        if coords is not None:
+            latitude, longitude, altitude = coords
+            d = {'id':id, 'latitude': latitude, 'longitude':longitude}
+            if altitude is not None:
+                d['altitude'] = altitude
+            d['seq'] = np.arange(1, len(latitude) + 1)
+            df = pd.DataFrame(d)
+            logger.debug('\t%s: points count: %s', id, len(df.index))
+    except Exception as err:
+        logger.error(f'Other error occurred: {err}')
+        raise
+    return df
+
+def encodegeometry(args, latitude, longitude, altitude=None):
+    """
+        Route points as a single value of the args.encode column
+        
+        Arguments
+        ---------
+            args    : from argparse, args.precision decimals are kept from the coordinates and
+                      args.altitude adds the altitudes when the router gives them
+            latitude, longitude, altitude : arrays from getroutecoords
+        Returns
+        -------
+            str: encoded polyline, or hex WKB of the line, None for a wkb line of a single point
+    """
+    if not args.altitude:
+        altitude = None
+    if args.encode == 'wkb':
+        if len(latitude) < 2:
+            return None # no line, as the --geometry of a single point
+        coordinates = [np.round(longitude, args.precision), np.round(latitude, args.precision)]
+        if altitude is not None:
+            coordinates.append(np.round(altitude, 2))
+        return shapely.to_wkb(shapely.linestrings(*coordinates), hex=True)
+    return encodepolyline(latitude, longitude, altitude, args.precision)
+
+def encodepolyline(latitude, longitude, altitude=None, precision=5):
+    """
+        Encoded polyline of the points, the Google algorithm with precision decimals
+        
+        The altitudes are encoded as a third value of each point, in centimetres, a missing
+        altitude as 0.
+        
+        Returns
+        -------
+            str: the encoded polyline
+    """
+    columns = [np.round(np.asarray(latitude, dtype=float) * 10 ** precision),
+               np.round(np.asarray(longitude, dtype=float) * 10 ** precision)]
+    if altitude is not None:
+        columns.append(np.round(np.nan_to_num(np.asarray(altitude, dtype=float)) * 100))
+    values = np.column_stack(columns).astype(np.int64)
+    # deltas between points, point by point, then zigzag so that the sign is the lowest bit
+    deltas = np.diff(values, axis=0, prepend=0).ravel()
+    deltas = (deltas << 1) ^ (deltas >> 63)
+    # 5 bits chunks, the lowest first, 0x20 set on all the chunks of a value but the last one
+    chunks = (deltas[:, None] >> (5 * np.arange(13))) & 0x1f
+    count = np.maximum(1, ((deltas[:, None] >> (5 * np.arange(13))) > 0).sum(axis=1))
+    used = np.arange(13) < count[:, None]
+    more = np.arange(13) < (count - 1)[:, None]
+    return ((chunks | (more * 0x20)) + 63)[used].astype(np.uint8).tobytes().decode('ascii')
+
+def decodepolyline(polyline, precision=5, altitude=False):
+    """
+        Points of an encoded polyline, the reverse of encodepolyline
+        
+        Arguments
+        ---------
+            polyline  : str
+            precision : decimals used by the encoding, --precision
+            altitude  : True if the polyline has altitudes, --altitude
+        Returns
+        -------
+            numpy array: a row of latitude, longitude (, altitude) for each point
+    """
+    dims = 3 if altitude else 2
+    if not polyline:
+        return np.empty((0, dims))
+    chunks = np.frombuffer(polyline.encode('ascii'), dtype=np.uint8).astype(np.int64) - 63
+    last = (chunks & 0x20) == 0
+    # rank of each chunk in its value
+    starts = np.flatnonzero(np.concatenate([[True], last[:-1]]))
+    rank = np.arange(len(chunks)) - np.repeat(starts, np.diff(np.append(starts, len(chunks))))
+    values = np.add.reduceat((chunks & 0x1f) << (5 * rank), starts)
+    values = (values >> 1) ^ -(values & 1)
+    points = np.cumsum(values.reshape(-1, dims), axis=0).astype(float)
+    points[:, :2] /= 10 ** precision
+    if altitude:
+        points[:, 2] /= 100
+    return points
+
+def decodepoints(df, column='polyline', precision=5, altitude=False):
+    """
+        Points table of the routes of a --summary --encode output, as getroutepoints gives it
+        
+        Arguments
+        ---------
+            df      : DataFrame with id and the column of encoded routes
+            column  : polyline or wkb
+            precision, altitude : --precision and --altitude of the output, for a polyline
+        Returns
+        -------
+            DataFrame: id,latitude,longitude(,altitude),seq
+    """
+    frames = []
+    for id, value in zip(df['id'], df[column]):
+        if not isinstance(value, str) or not value:
+            continue
+        if column == 'wkb':
+            coordinates = shapely.get_coordinates(shapely.from_wkb(value), include_z=altitude)
+            points = coordinates[:, [1, 0, 2][:coordinates.shape[1]]]
+        else:
+            points = decodepolyline(value, precision, altitude)
+        d = {'id': id, 'latitude': points[:, 0], 'longitude': points[:, 1]}
+        if points.shape[1] > 2:
+            d['altitude'] = points[:, 2]
+        d['seq'] = np.arange(1, len(points) + 1)
+        frames.append(pd.DataFrame(d))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def simplifygeometries(geometries, tolerance):
+    """
+        Douglas-Peucker simplification of an array of geometries with a tolerance in metres
+        
+        The longitudes are scaled by the cosine of the latitude of each point, so that a degree
+        is about as long on both axes, before shapely simplifies all the geometries in one call.
+        
+        Arguments
+        ---------
+            geometries : array of shapely geometries in lon lat
+            tolerance  : in metres
+        Returns
+        -------
+            array of the simplified geometries, the altitudes of the points kept are kept
+    """
+    def scale(coordinates):
+        coordinates[:, 0] *= np.cos(np.radians(coordinates[:, 1]))
+        return coordinates
+
+    def unscale(coordinates):
+        # rounded to drop the float error of the scaling, 1e-9 degree is under a millimetre
+        coordinates[:, 0] = np.round(coordinates[:, 0] / np.cos(np.radians(coordinates[:, 1])), 9)
+        return coordinates
+
+    geometries = shapely.transform(np.asarray(geometries, dtype=object), scale, include_z=True)
+    geometries = shapely.simplify(geometries, tolerance / 111320.0, preserve_topology=True)
+    return shapely.transform(geometries, unscale, include_z=True)
+
+def simplifyresults(args, df):
+    """
+        Simplify the routes of a chunk of results with args.simplify metres and drop their altitudes
+        with args.drop_altitude, before they are written
+        
+        The geometry column, the --encode column and the point tables of the routes are simplified,
+        each with one shapely call for the whole chunk.
+        
+        Arguments
+        ---------
+            args    : from argparse
+            df      : results of routefinder or isochronefinder
+        Returns
+        -------
+            the simplified df
+    """
+    if df.empty or (args.simplify <= 0 and not args.drop_altitude):
+        return df
+    if 'geometry' in df.columns:
+        geometries = np.asarray(df['geometry'], dtype=object)
+        if args.simplify > 0:
+            geometries = simplifygeometries(geometries, args.simplify)
+        if args.drop_altitude:
+            geometries = shapely.force_2d(geometries)
+        df = df.copy()
+        df['geometry'] = geometries
+    if args.encode == 'wkb' and 'wkb' in df.columns:
+        geometries = shapely.from_wkb(df['wkb'].to_numpy(dtype=object))
+        if args.simplify > 0:
+            geometries = simplifygeometries(geometries, args.simplify)
+        if args.drop_altitude:
+            geometries = shapely.force_2d(geometries)
+        df = df.assign(wkb=shapely.to_wkb(geometries, hex=True))
+    elif args.encode == 'polyline' and 'polyline' in df.columns:
+        points = [decodepolyline(value, args.precision, args.altitude) if isinstance(value, str) else None
+                  for value in df['polyline']]
+        lines = np.array([shapely.linestrings(value[:, [1, 0, 2][:value.shape[1]]])
+                          if value is not None and len(value) > 1 else None for value in points], dtype=object)
+        if args.simplify > 0:
+            lines = simplifygeometries(lines, args.simplify)
+        polylines = []
+        for line, value in zip(lines, points):
+            if line is None:
+                polylines.append(encodepolyline(value[:, 0], value[:, 1], None if args.drop_altitude or not args.altitude
+                                                else value[:, 2], args.precision) if value is not None else value)
+                continue
+            coordinates = shapely.get_coordinates(line, include_z=args.altitude)
+            polylines.append(encodepolyline(coordinates[:, 1], coordinates[:, 0],
+                                            None if args.drop_altitude or not args.altitude else coordinates[:, 2],
+                                            args.precision))
+        df = df.assign(polyline=polylines)
+    elif {'latitude', 'longitude', 'seq'} <= set(df.columns):
+        # point tables: a line per route, simplified, then back to points
+        if args.drop_altitude and 'altitude' in df.columns:
+            df = df.drop(columns=['altitude'])
+        if args.simplify > 0:
+            df = df.reset_index(drop=True)
+            codes, ids = pd.factorize(df['id'])
+            counts = np.bincount(codes, minlength=len(ids))
+            lines = (counts[codes] > 1)
+            columns = ['longitude', 'latitude'] + (['altitude'] if 'altitude' in df.columns else [])
+            coordinates = df.loc[lines, columns].to_numpy(dtype=float)
+            linecodes = np.unique(codes[lines])
+            geometries = shapely.linestrings(coordinates, indices=np.searchsorted(linecodes, codes[lines]))
+            geometries = simplifygeometries(geometries, args.simplify)
+            coordinates, index = shapely.get_coordinates(geometries, include_z=len(columns) > 2, return_index=True)
+            # the routes of a single point are kept as they are
+            simplified = pd.DataFrame({'id': ids[linecodes[index]], 'latitude': coordinates[:, 1],
+                                       'longitude': coordinates[:, 0]})
+            if len(columns) > 2:
+                simplified['altitude'] = coordinates[:, 2]
+            simplified['seq'] = simplified.groupby('id', sort=False).cumcount() + 1
+            df = pd.concat([simplified, df.loc[~lines, simplified.columns]], sort=False)
+            # back to the order of the routes in the chunk
+            df = df.iloc[np.argsort(pd.Categorical(df['id'], categories=ids).codes, kind='stable')]
+    return df
+
+def getApiKey(args):
+    """
+        Read a text key file in args.key with the key for the API
+
+        Arguments
+        ---------
+            args    : from argparse
+        Returns
+        -------
+            string with the key
+    """
+    data=''
+    try:
+        with open(f'{args.key}', 'r') as file:
+            data = file.read().replace('\n', '')
+    except Exception as err:
+        logger.error(f'Error occurred: {err}')
+    return data
+
+def saveResults(args,df):
+    """
+        Save df results in the format of the args.outfile extension
+        Write file in args.outfile
+        
+        Arguments
+        ---------
+            args    : from argparse
+            df      : GeoDataFrame if args.summary, DataFrame otherwise
+    """
+    writer = ResultWriter(args)
+    writer.write(df)
+    writer.close()
+
+
+class ResultWriter:
+    """
+        Write the results in args.outfile as they come, the first chunk creates the file and sets
+        the columns, the next ones are appended
+        
+        The format is chosen by the args.outfile extension (output_formats): .csv, with the lines
+        of args.summary and args.geometry or the polygons of args.isochrone as WKT, .gpkg, .fgb
+        (FlatGeobuf) or .parquet (GeoParquet when there is a geometry). Only that format is written,
+        unless args.gpkg_copy asks for the lines or polygons of a .csv in a gpkg next to it too. The
+        spatial formats get points from the latitude, longitude columns when the results have no
+        geometry. The parquet chunks are written as parts in args.outfile.parts and gathered in
+        args.outfile by close.
+    """
+    def __init__(self, args):
+        self.args = args
+        self.columns = None
+        self.rows = 0
+        self.layer, extension = os.path.splitext(os.path.basename(args.outfile))
+        self.format = output_formats.get(extension.lower(), 'csv')
+        if self.format == 'gpkg':
+            self.gpkg = args.outfile
+            self.gpkgoutput = True
+        else:
+            self.gpkg = os.path.join(os.path.dirname(args.outfile), f'{self.layer}.gpkg')
+            self.gpkgoutput = self.format == 'csv' and args.gpkg_copy and ((args.summary & args.geometry) or args.isochrone)
+        self.parts = f'{args.outfile}.parts'
+        self.partcount = 0
+        self.schema = None
+
+    def write(self, df, simplify=True):
+        """
+            Append df to the output files
+            
+            Arguments
+            ---------
+                df      : GeoDataFrame if args.summary, DataFrame otherwise
+                simplify : False for rows read back from a previous output, already simplified
+        """
+        if simplify:
+            df = simplifyresults(self.args, df)
+        if df.empty:
+            return
+        if self.columns is None:
+            mode = 'w'
+            self.columns = list(df.columns)
+        else:
+            # a column missing from the first chunk can not be added to the csv anymore
+            mode = 'a'
+            df = df.reindex(columns=self.columns)
+        if self.format == 'csv':
+            df.to_csv(self.args.outfile, mode=mode, index=False, header=(mode == 'w'))
+        elif self.format in ['gpkg', 'fgb']:
+            df = self.spatial(df)
+        if self.gpkgoutput:
+            df.to_file(self.gpkg, layer=self.layer, driver="GPKG", mode=mode)
+        elif self.format == 'fgb':
+            # without a spatial index the features keep the order they are written in
+            df.to_file(self.args.outfile, driver="FlatGeobuf", mode=mode, SPATIAL_INDEX='NO')
+        elif self.format == 'parquet':
+            self.writepart(df)
+        self.rows += len(df.index)
+
+    def read(self, chunksize, columns=None):
+        """
+            Read back the rows of the output files, chunksize rows at a time
+            
+            Arguments
+            ---------
+                chunksize : number of rows of a chunk
+                columns : list of the columns in the order they were written, as the chunks are read
+                          from the gpkg when there is one, with the geometry last
+            Yields
+            ------
+                DataFrame, or GeoDataFrame with the geometry
+        """
+        if self.format == 'csv' and not self.gpkgoutput:
+            try:
+                for df in pd.read_csv(self.args.outfile, dtype={'id':'str'}, chunksize=chunksize):
+                    yield df
+            except pd.errors.EmptyDataError:
+                pass # no rows saved
+        elif self.format == 'parquet':
+            for batch in pq.ParquetFile(self.args.outfile).iter_batches(batch_size=chunksize):
+                df = batch.to_pandas()
+                if 'geometry' in df.columns:
+                    df = gpd.GeoDataFrame(df, geometry=gpd.GeoSeries.from_wkb(df['geometry']), crs='EPSG:4326')
+                yield df
+        else:
+            source = self.gpkg if self.gpkgoutput else self.args.outfile
+            layer = self.layer if self.gpkgoutput else None
+            start = 0
+            while True:
+                df = gpd.read_file(source, layer=layer, rows=slice(start, start + chunksize))
+                if df.empty:
+                    break
+                df['id'] = df['id'].astype(str)
+                yield df.reindex(columns=columns) if columns else df
+                start += chunksize
+
+    def spatial(self, df):
+        """
+            GeoDataFrame of df, with points at latitude, longitude if df has no geometry
+        """
+        if 'geometry' in df.columns:
+            return gpd.GeoDataFrame(df, geometry='geometry', crs='EPSG:4326')
+        return gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df['longitude'], df['latitude']), crs='EPSG:4326')
+
+    def writepart(self, df):
+        """
+            Save df as the next parquet part, the geometry as WKB with the GeoParquet metadata
+        """
+        df = pd.DataFrame(df)
+        if 'geometry' in df.columns:
+            df['geometry'] = shapely.to_wkb(np.asarray(df['geometry'], dtype=object))
+        if self.schema is None:
+            schema = pa.Table.from_pandas(df, preserve_index=False).schema
+            if 'geometry' in df.columns:
+                geo = {'version': '1.0.0', 'primary_column': 'geometry',
+                       'columns': {'geometry': {'encoding': 'WKB', 'geometry_types': [],
+                                                'crs': pyproj.CRS.from_epsg(4326).to_json_dict()}}}
+                schema = schema.with_metadata({**(schema.metadata or {}), b'geo': json.dumps(geo).encode('utf-8')})
+            self.schema = schema
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        os.makedirs(self.parts, exist_ok=True)
+        pq.write_table(table, self.partname(self.partcount))
+        self.partcount += 1
+
+    def partname(self, number):
+        return os.path.join(self.parts, f'{number:06d}.parquet')
+
+    def resume(self, state):
+        """
+            Go back to the outputs of a previous run, as recorded by the last RunManifest.commit
+            
+            Arguments
+            ---------
+                state   : dict with rows, csv size in bytes, gpkg feature count, parquet part count
+                          and columns
+        """
+        self.rows = state['rows']
+        if self.rows == 0:
+            return # nothing saved yet, the next chunk starts the files again
+        self.columns = state.get('columns')
+        if self.format == 'csv':
+            with open(self.args.outfile, 'r+') as file:
+                file.truncate(state['csv']) # drop a chunk written after the last commit
+                file.seek(0)
+                self.columns = file.readline().rstrip('\n').split(',')
+        if self.gpkgoutput:
+            connection = sqlite3.connect(self.gpkg)
+            connection.execute(f'DELETE FROM "{self.layer}" WHERE fid > ?', (state['gpkg'],))
+            connection.commit()
+            connection.close()
+        elif self.format == 'fgb':
+            # FlatGeobuf features can not be deleted, the saved ones are written again
+            saved = gpd.read_file(self.args.outfile, rows=self.rows)
+            saved.to_file(self.args.outfile, driver="FlatGeobuf", mode='w', SPATIAL_INDEX='NO')
+        elif self.format == 'parquet':
+            self.partcount = state['parts']
+            for name in os.listdir(self.parts):
+                if name.endswith('.parquet') and int(name[:-8]) >= self.partcount:
+                    os.remove(os.path.join(self.parts, name))
+            self.schema = pq.read_schema(self.partname(0))
+
+    def state(self):
+        """
+            Returns
+            -------
+                dict: size of the outputs to give back to resume
+        """
+        return {'rows': self.rows,
+                'csv': os.path.getsize(self.args.outfile) if self.format == 'csv' and self.columns else 0,
+                'gpkg': self.rows if self.gpkgoutput else 0, 'parts': self.partcount, 'columns': self.columns}
+
+    def close(self):
+        if self.format == 'parquet':
+            # the parts are copied a row group at a time, a file is written even without rows
+            writer = pq.ParquetWriter(self.args.outfile, self.schema or pa.schema([]))
+            for number in range(self.partcount):
+                partfile = pq.ParquetFile(self.partname(number))
+                for group in range(partfile.num_row_groups):
+                    writer.write_table(partfile.read_row_group(group))
+            writer.close()
+            for number in range(self.partcount):
+                os.remove(self.partname(number))
+            if os.path.isdir(self.parts):
+                os.rmdir(self.parts)
+        elif self.columns is None and self.format == 'csv':
+            pd.DataFrame().to_csv(self.args.outfile, index=False, header=True)
+        logger.info(f'{self.rows} rows saved in {self.args.outfile}')
+
+
+def checkoutput(args):
+    """
+        Check that the args.outfile format can hold the results
+        
+        Returns
+        -------
+            bool: False, with a message, if it can not
+    """
+    outputformat = output_formats.get(os.path.splitext(args.outfile)[1].lower(), 'csv')
+    if outputformat == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        logger.error('writing a .parquet --outfile needs pyarrow (pip install pyarrow)')
+        return False
+    if outputformat in ['gpkg', 'fgb'] and args.route and args.summary and not args.geometry:
+        logger.error(f'a .{outputformat} --outfile needs --geometry with --summary')
+        return False
+    if outputformat in ['gpkg', 'fgb'] and args.route and args.depart_times:
+        logger.error(f'a .{outputformat} --outfile can not hold the --depart-times table, use .csv or .parquet')
+        return False
+    return True
+
+def filechecksum(filename):
+    """
+        sha256 of a file, read 1MB at a time
+    """
+    checksum = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def outputsettings(args):
+    """
+        Arguments shaping the rows of args.outfile, an --incremental run keeps the rows of a previous
+        run only if they are the same
+    """
+    return {name: vars(args).get(name) for name in ['isochrone', 'summary', 'geometry', 'encode', 'precision',
+                                                    'altitude', 'simplify', 'drop_altitude', 'depart_times',
+                                                    'gpkg_copy']}
+
+def rowfingerprint(args, start, end):
+    """
+        Fingerprint of an args.infile row: a hash of its request, i.e. router, profile, weighting,
+        travelMode and coordinates rounded to args.round decimals
+        
+        Returns
+        -------
+            str: 16 hex digits
+    """
+    return hashlib.sha256(requestkey(args, start, end, args.round).encode('utf-8')).hexdigest()[:16]
+
+
+def routedids(df):
+    """
+        set of the ids with rows in the results df of a chunk
+    """
+    if df.empty or 'id' not in df.columns:
+        return set()
+    return set(df['id'].astype(str))
+
+
+class RunManifest:
+    """
+        Journal of an --infile run, saved as json lines next to args.outfile
+        
+        The first line records the args.infile checksum and the output settings, then each chunk
+        written adds a line with the ids it routed, their fingerprints and the size of the outputs;
+        the rows that failed are left out, so that the next run requests them again. A line is flushed
+        to disk before the next chunk starts, so that --resume finds the rows to skip and the point
+        to append from after a crash, and --incremental the rows routed by the last run.
+    """
+    def __init__(self, args):
+        self.path = args.manifest or f'{args.outfile}.manifest'
+        self.checksum = filechecksum(args.infile)
+        self.done = set()
+        self.fingerprints = {}
+        self.state = None
+        self.complete = False
+        self.file = None
+
+    def read(self):
+        """
+            Returns
+            -------
+                list of dict: the lines of the journal, but a last line cut by a crash
+        """
+        with open(self.path, 'r') as file:
+            lines = []
+            for line in file:
+                try:
+                    lines.append(json.loads(line))
+                except ValueError:
+                    pass # last line cut by the crash
+        return lines
+
+    def load(self):
+        """
+            Read the journal of the previous run
+            
+            Returns
+            -------
+                bool: False if there is no journal or args.infile changed since
+        """
+        if not os.path.isfile(self.path):
+            logger.error(f'no manifest {self.path} to resume from')
+            return False
+        lines = self.read()
+        if not lines or lines[0].get('checksum') != self.checksum:
+            logger.error(f'{self.path} does not match the current --infile, can not resume')
+            return False
+        for line in lines[1:]:
+            if 'ids' in line:
+                self.done.update(line['ids'])
+                self.state = line['outputs']
+            self.complete = line.get('complete', self.complete)
+        self.file = open(self.path, 'a')
+        return True
+
+    def loadprevious(self, args):
+        """
+            Read the fingerprints of the rows routed by the previous run, for --incremental
+            
+            Returns
+            -------
+                bool: False, with a message, if the previous run did not complete, saved no
+                      fingerprints or wrote its outputs with other settings
+        """
+        if not os.path.isfile(self.path) or not os.path.isfile(args.outfile):
+            logger.info(f'no previous run on {args.outfile}')
+            return False
+        lines = self.read()
+        if not lines or lines[0].get('settings') != outputsettings(args):
+            logger.info(f'{self.path} was written with other output settings')
+            return False
+        for line in lines[1:]:
+            if 'ids' in line:
+                if 'fingerprints' not in line:
+                    logger.info(f'{self.path} has no fingerprints')
+                    return False
+                self.fingerprints.update(zip(line['ids'], line['fingerprints']))
+                self.state = line['outputs']
+            self.complete = line.get('complete', self.complete)
+        if not self.complete:
+            logger.info(f'the run of {self.path} did not complete')
+        return self.complete
+
+    def start(self, args):
+        self.file = open(self.path, 'w')
+        self.write({'infile': args.infile, 'checksum': self.checksum, 'outfile': args.outfile,
+                    'settings': outputsettings(args), 'started': datetime.datetime.now().isoformat()})
+
+    def commit(self, ids, outputs, fingerprints=None, routed=None):
+        """
+            Journal a chunk written
+            
+            Arguments
+            ---------
+                ids     : list of the ids of the chunk
+                outputs : state of the ResultWriter
+                fingerprints : list of the fingerprints of ids, None for the isochrones
+                routed  : set of the ids with rows in the outputs, the other ids, that failed or got no
+                          response, are left out so that the next --resume or --incremental run
+                          requests them again
+        """
+        if routed is not None:
+            if fingerprints is not None:
+                fingerprints = [fingerprint for id, fingerprint in zip(ids, fingerprints) if id in routed]
+            ids = [id for id in ids if id in routed]
+        self.done.update(ids)
+        line = {'ids': ids, 'outputs': outputs}
+        if fingerprints is not None:
+            line['fingerprints'] = fingerprints
+        self.write(line)
+
+    def write(self, line):
+        self.file.write(json.dumps(line) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self, complete):
+        if complete:
+            self.write({'complete': True, 'finished': datetime.datetime.now().isoformat()})
+        self.file.close()
+
+def routestofile(args, key, iterfunction=None):
+    """
+        Route args.infile and append the results to args.outfile chunk by chunk, journaling each
+        chunk in the run manifest; with args.resume, carry on from the last chunk of the journal
+        
+        Arguments
+        ---------
+            args    : from argparse
+            key     : api key value
+            iterfunction : iterroutes, or iterisochrones for the isochrones
+    """
+    iterfunction = iterfunction or iterroutes
+    manifest = RunManifest(args)
+    writer = ResultWriter(args)
+    if args.resume:
+        if not manifest.load():
+            return
+        if manifest.state is not None:
+            writer.resume(manifest.state)
+        logger.info(f'resume {args.infile}: {len(manifest.done)} ids already saved')
+    else:
+        manifest.start(args)
+    stats = RunStats()
+    total = None
+    if args.progress > 0:
+        total = countrows(args.infile) - len(manifest.done)
+    reporter = MetricsReporter(args, stats, total)
+    complete = False
+    try:
+        for ids, df, fingerprints in iterfunction(args, key, manifest.done, stats):
+            with stats.time('write seconds'):
+                writer.write(df)
+            manifest.commit(ids, writer.state(), fingerprints, routedids(df))
+            stats.add('rows done', len(ids))
+        complete = True
+    finally:
+        manifest.close(complete)
+        reporter.close()
+    writer.close()
+
+class PreviousRows:
+    """
+        Rows of args.outfile written by the last run, handed out by id as an --incremental run reads
+        args.infile again
+        
+        args.outfile is read once, in the order of the ids of the previous manifest, which is the order
+        they were written in. The rows read ahead of the ids asked for wait in a buffer, so only the
+        rows moved down args.infile since, and the ones of the ids deleted from it, are held in memory.
+    """
+    def __init__(self, args, previous):
+        self.chunks = ResultWriter(args).read(args.chunksize, (previous.state or {}).get('columns'))
+        self.positions = {id: position for position, id in enumerate(previous.fingerprints)}
+        self.buffer = []
+        self.position = -1 # of the last id read
+        self.dropped = set()
+
+    def take(self, ids, done):
+        """
+            Arguments
+            ---------
+                ids     : list of the ids of the rows to hand out
+                done    : list of the ids of the args.infile chunk, whose rows are not needed anymore
+            Returns
+            -------
+                list of DataFrame: the rows of ids, in the order of args.outfile
+        """
+        ids = set(ids)
+        self.dropped.update(id for id in done if id not in ids)
+        last = max((self.positions[id] for id in ids), default=-1)
+        # the rows of an id can go on in the next chunk, until a later id starts
+        while self.position <= last:
+            df = next(self.chunks, None)
+            if df is None:
+                break
+            df = df[~df['id'].astype(str).isin(self.dropped)]
+            if not df.empty:
+                self.position = max(self.position, df['id'].astype(str).map(self.positions).max())
+                self.buffer.append(df)
+        taken = []
+        buffer = []
+        for df in self.buffer:
+            selected = df['id'].astype(str).isin(ids)
+            if selected.any():
+                taken.append(df[selected])
+            df = df[~selected & ~df['id'].astype(str).isin(self.dropped)]
+            if not df.empty:
+                buffer.append(df)
+        self.buffer = buffer
+        self.dropped.update(ids)
+        return taken
+
+def updatefile(args, key, iterfunction=None):
+    """
+        Route the args.infile rows new or changed since the last complete run on args.outfile and
+        merge them with the rows of args.outfile still in args.infile
+        
+        The fingerprints of the rows of each chunk are compared with the ones of the previous run
+        manifest. The rows kept and the new routes are written in the args.infile order to
+        args.outfile.incremental, with a new manifest, then moved in place once complete, so that the
+        previous outputs stay whole after a crash. Without a complete previous run with the same
+        output settings, every row is routed.
+        
+        Arguments
+        ---------
+            args    : from argparse
+            key     : api key value
+            iterfunction : iterroutes or iterdeparts
+    """
+    iterfunction = iterfunction or iterroutes
+    previous = RunManifest(args)
+    if not previous.loadprevious(args):
+        logger.info(f'incremental {args.infile}: routing every row')
+        routestofile(args, key, iterfunction)
+        return
+    workdir = f'{args.outfile}.incremental'
+    shutil.rmtree(workdir, ignore_errors=True) # left by a run that did not complete
+    os.makedirs(workdir)
+    workargs = argparse.Namespace(**{**vars(args), 'outfile': os.path.join(workdir, os.path.basename(args.outfile)),
+                                     'manifest': os.path.join(workdir, os.path.basename(previous.path))})
+    manifest = RunManifest(workargs)
+    manifest.start(args)
+    writer = ResultWriter(workargs)
+    rows = PreviousRows(args, previous)
+    stats = RunStats()
+    reporter = MetricsReporter(args, stats, countrows(args.infile) if args.progress > 0 else None)
+    kept = 0
+    seen = set()
+    complete = False
+    try:
+        for ids, df, fingerprints in iterfunction(args, key, previous.fingerprints, stats):
+            keptids = [id for id, fingerprint in zip(ids, fingerprints) if previous.fingerprints.get(id) == fingerprint]
+            kept += len(keptids)
+            with stats.time('write seconds'):
+                dfs = rows.take(keptids, ids)
+                if not df.empty:
+                    dfs.append(simplifyresults(args, df))
+                if dfs:
+                    # the rows kept and the new routes in the args.infile order, with the crs of the outputs
+                    positions = {id: position for position, id in enumerate(ids)}
+                    df = pd.concat([df.set_crs('EPSG:4326', allow_override=True)
+                                    if hasattr(df, 'set_crs') and 'geometry' in df.columns else df
+                                    for df in dfs], sort=False)
+                    df = df.iloc[np.argsort(df['id'].astype(str).map(positions).to_numpy(), kind='stable')]
+                    writer.write(df, simplify=False)
+            manifest.commit(ids, writer.state(), fingerprints, routedids(df))
+            seen.update(ids)
+            stats.add('rows done', len(ids))
+        complete = True
+    finally:
+        manifest.close(complete)
+        reporter.close()
+    writer.close()
+    os.replace(workargs.outfile, args.outfile)
+    if writer.gpkgoutput and writer.format == 'csv':
+        os.replace(writer.gpkg, ResultWriter(args).gpkg)
+    os.replace(workargs.manifest, previous.path)
+    os.rmdir(workdir)
+    logger.info(f'{args.outfile} updated: {len(manifest.done) - kept} new or changed rows, {kept} unchanged, '
+                f'{len(seen) - len(manifest.done)} without a route, {len(previous.fingerprints.keys() - seen)} deleted')
+
+def quickpath(args):
+    """
+        Tell if the route of --start and --end can be written by quickroute
+        
+        Returns
+        -------
+            bool: True for a --summary csv of tomtom or ors without geometry, matrix, batch nor snap
+    """
+    return (not args.infile and args.summary and not args.geometry and not args.encode
+            and args.router in ['tomtom', 'ors'] and not args.matrix and not args.batch and args.snap <= 0
+            and output_formats.get(os.path.splitext(args.outfile)[1].lower(), 'csv') == 'csv')
+
+def quickroute(args, key):
+    """
+        Route --start to --end and write its summary in plain python, with urllib and csv
+        
+        A single summary route needs neither requests nor pandas nor geopandas, which take most
+        of the start up time. Same cache, retries and csv as routefinder and saveResults.
+        
+        Arguments
+        ---------
+            args    : from argparse
+            key     : api key value
+    """
+    templates = RequestTemplates(args, key)
+    start, end = args.start, args.end
+    id = os.path.splitext(os.path.basename(args.outfile))[0]
+    data = None
+    cache = cachekey = None
+    if args.json:
+        cache = opencache(args)
+        cachekey = requestkey(args, start, end)
+        data = cache.get(cachekey, id)
+    if data is None:
+        method, url, body, headers = templates.routerequest(start, end, id)
+        limiter = RateLimiter(None)
+        retry = RetryPolicy(args.retries, args.backoff, args.backoff_max, args.jitter, args.retry_budget)
+        for attempt in range(retry.attempts):
+            limiter.acquire()
+            response = urlsend(method, url, body, headers, args.timeout)
+            limiter.update(response)
+            if not istransient(response):
+                break
+            if attempt + 1 == retry.attempts:
+                logger.error('\t%s : giving up after %s attempts', id, retry.attempts)
+            elif not retry.spend():
+                logger.error('\t%s : retry budget of %s exhausted', id, retry.budget)
+                break
+            else:
+                tm.sleep(retry.delay(attempt))
+        if response is not None:
+            logger.debug('%s %s', response.status_code, response.reason)
+        data = getJSONText(response, id)
+        if cache is not None:
+            if istransient(response):
+                logger.warning(f'\t{id} : not saved in {cache.name(cachekey, id)}, will be requested again')
+            else:
+                cache.put(cachekey, id, data, start, end)
+    if cache is not None:
+        cache.close()
+    pyroute = json.loads(data) if data else None
+    rows = 0
+    with open(args.outfile, 'w', newline='') as file:
+        if countpoints(args, pyroute) > 0:
+            row = {'id': id, **getroutesummary(args, pyroute)}
+            writer = csv.writer(file, lineterminator='\n')
+            writer.writerow(row.keys())
+            writer.writerow(row.values())
+            rows = 1
+        else:
+            file.write('\n') # as pandas writes an empty DataFrame
+    logger.info(f'{rows} rows saved in {args.outfile}')
+
+def countrows(filename):
+    """
+        Number of rows of a csv file with a header, its newlines counted 1MB at a time
+    """
+    count = 0
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            count += block.count(b'\n')
+    return max(count - 1, 0)
+
+def handler(args):
+    """ 
+        Main handler 
+    """
+    logger.info('route.py starting\n')
+    if args.check:
         check(args)
+    if args.migrate:
+        migratejsondir(args)
+    if args.buildgraph:
+        buildgraph(args)
     if args.route:
         for key in vars(args).keys():
-            print(f'\t{key} : {vars(args)[key]}')
+            logger.debug(f'\t{key} : {vars(args)[key]}')
         key = getApiKey(args)
-        if args.infile:
-            df = routesfromfile(args,key)
+        if args.matrix and (args.router != 'ors' or not args.summary or args.geometry or not args.infile
+                            or orsapi(args) == 'v1'):
+            logger.error('--matrix needs --infile --router ors --summary, without --geometry, and a v2 api')
+            return
+        if args.batch and (args.router != 'tomtom' or not args.infile):
+            logger.error('--batch needs --infile --router tomtom')
+            return
+        if args.snap > 0 and (not args.json or args.matrix or args.router == 'local'):
+            logger.error('--snap needs --json, and is not used by --matrix nor --router local')
+            return
+        if args.encode and (not args.summary or args.matrix):
+            logger.error('--encode needs --summary, without --matrix')
+            return
+        if args.depart_times:
+            if args.router != 'tomtom' or not args.infile or args.matrix or args.geometry or args.encode:
+                logger.error('--depart-times needs --infile --router tomtom, without --matrix, --geometry nor --encode')
+                return
+            try:
+                args.depart_times = departtimes(args.depart_times)
+            except ValueError as err:
+                logger.error(f'--depart-times: {err}')
+                return
+            logger.info(f'--depart-times: {len(args.depart_times)} departure times from {args.depart_times[0]} '
+                        f'to {args.depart_times[-1]}')
+        if args.incremental and (not args.infile or args.resume):
+            logger.error('--incremental needs --infile, without --resume')
+            return
+        if not checkoutput(args):
+            return
+        if args.matrix and args.route_weighting == 'shortest':
+            logger.warning('--matrix: the matrix api gives the length and time of the fastest routes')
+        if args.infile and args.incremental:
+            updatefile(args, key, iterdeparts if args.depart_times else None)
+        elif args.infile:
+            routestofile(args, key, iterdeparts if args.depart_times else None)
+        elif quickpath(args):
+            quickroute(args, key)
+        else:
+            client = RouteClient(args=args, key=key, concurrency=args.workers)
+            try:
+                df = client.frames([(os.path.splitext(os.path.basename(args.outfile))[0], args.start, args.end)])[0]
+            finally:
+                client.close()
             saveResults(args,df)
+    if args.isochrone:
+        for key in vars(args).keys():
+            logger.debug(f'\t{key} : {vars(args)[key]}')
+        if args.router != 'ors':
+            logger.error('--isochrone needs --router ors')
+            return
+        key = getApiKey(args)
+        if not checkoutput(args):
+            return
+        if args.infile:
+            routestofile(args, key, iterisochrones)
         else:
-            df = routefinder(args, args.start, args.end, os.path.basename(args.outfile[:-4]), key)
+            df = isochronefinder(args, args.start, args.ranges, os.path.splitext(os.path.basename(args.outfile))[0], key)
             saveResults(args,df)
-    # if args.isochrone:
-    #     for key in vars(args).keys():
-    #         print(f'\t{key} : {vars(args)[key]}')
-    #     key = getApiKey(args)
-    #     if args.infile:
-    #         df = isochronesfromfile(args,key)
-    #         saveResults(args,df)
-    print('\nroute.py closing')
+    logger.info('\nroute.py closing')
 
 
 def check(args):
-    print('check arguments')
+    logger.info('check arguments')
     for key in vars(args).keys():
-        print(f'\t{key} : {vars(args)[key]}')
+        logger.info(f'\t{key} : {vars(args)[key]}')
+
+def departtimes(values):
+    """
+        Departure times of --depart-times
+        
+        Arguments
+        ---------
+            values  : list of str, times like 2026-10-20T07:30 or sweeps start/end/step like
+                      2026-10-20T06:00/2026-10-20T20:00/15min, end included, step in s, min or h,
+                      minutes without unit
+        Returns
+        -------
+            list of str: the times in the departAt format, sorted, without duplicates
+    """
+    times = set()
+    for value in values:
+        parts = value.split('/')
+        start = datetime.datetime.fromisoformat(parts[0])
+        if len(parts) == 1:
+            times.add(start)
+            continue
+        if len(parts) != 3:
+            raise ValueError(f'{value} is neither a time nor a start/end/step sweep')
+        end = datetime.datetime.fromisoformat(parts[1])
+        step = re.fullmatch(r'([0-9]*\.?[0-9]+)\s*([a-z]*)', parts[2].lower())
+        seconds = {'': 60, 's': 1, 'sec': 1, 'min': 60, 'm': 60, 'h': 3600, 'hour': 3600}
+        if step is None or step.group(2) not in seconds or float(step.group(1)) <= 0:
+            raise ValueError(f'unknown step in {value}')
+        step = datetime.timedelta(seconds=float(step.group(1)) * seconds[step.group(2)])
+        while start <= end:
+            times.add(start)
+            start += step
+    return [time.strftime('%Y-%m-%dT%H:%M:%S') for time in sorted(times)]
 
 def tomorrow2am():
     now = datetime.datetime.today()
@@ -741,7 +3906,8 @@ def main():
     """
     myrouter = Router()
     args = myrouter.parser.parse_args()
-    print(f'geometry: {args.geometry} json: {args.json} summary: {args.summary}')
+    logging.basicConfig(stream=sys.stdout, format='%(message)s', level=getattr(logging, args.log_level))
+    logger.debug(f'geometry: {args.geometry} json: {args.json} summary: {args.summary}')
     if args.fonc: 
         args.fonc(args)
     